@@ -1,27 +1,32 @@
-from collections.abc import Generator
-from typing import Annotated
+from collections.abc import AsyncGenerator
+from typing import TYPE_CHECKING, Annotated
 from uuid import UUID
 
-import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, Request, WebSocketException, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
-from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.requests import HTTPConnection
 
-from app.core import security
+from app.chatbot.jobs import JobQueue
+from app.core import auth_cache
 from app.core.config import settings
-from app.core.database import engine
-from app.models import TokenPayload, User
+from app.core.database import create_session
+from app.models import User
 
+if TYPE_CHECKING:
+    # The chatbot stack is only imported when the application starts, see `app.main.lifespan`
+    from app.chatbot.chatbot_core import Chatbot
 
-def get_session() -> Generator[Session, None, None]:
+
+async def get_session() -> AsyncGenerator[AsyncSession, None]:
     """Dependency for getting database sessions"""
-    with Session(engine) as session:
+    async with create_session() as session:
         yield session
 
 
-SessionDependency = Annotated[Session, Depends(get_session)]
+SessionDependency = Annotated[AsyncSession, Depends(get_session)]
 
 
 reusable_oauth2 = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/login/access-token")
@@ -30,17 +35,20 @@ reusable_oauth2 = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/login/ac
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDependency, token: TokenDep) -> User:
+async def authenticate_token(session: AsyncSession, token: str) -> User:
+    """
+    Return the user of an access token.
+    Decoded tokens and users are cached, so repeated requests do not touch the database.
+    """
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[security.ALGORITHM])
-        token_data = TokenPayload(**payload)
+        token_data = auth_cache.decode_token(token)
     except (InvalidTokenError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
 
-    user = session.get(User, UUID(token_data.sub))
+    user = await auth_cache.get_user(session, UUID(token_data.sub))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -48,10 +56,47 @@ def get_current_user(session: SessionDependency, token: TokenDep) -> User:
     return user
 
 
+async def get_current_user(session: SessionDependency, token: TokenDep) -> User:
+    """Authenticate the request from its access token."""
+    return await authenticate_token(session, token)
+
+
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
+async def get_websocket_user(token: Annotated[str, Query()]) -> User:
+    """
+    Authenticate a WebSocket from the access token passed as the `token` query parameter,
+    since browsers cannot set headers on WebSockets.
+    """
+    # A session of its own, so the WebSocket does not keep a database connection for its whole lifetime
+    async with create_session() as session:
+        try:
+            return await authenticate_token(session, token)
+        except HTTPException as error:
+            raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=error.detail)
+
+
+WebSocketUser = Annotated[User, Depends(get_websocket_user)]
+
+
 def get_current_active_superuser(current_user: CurrentUser) -> User:
     if not current_user.is_superuser:
         raise HTTPException(status_code=403, detail="The user doesn't have enough privileges")
     return current_user
+
+
+def get_chatbot(request: Request) -> "Chatbot":
+    """Dependency for getting the chatbot created during the application startup"""
+    return request.app.state.chatbot
+
+
+ChatbotDependency = Annotated["Chatbot", Depends(get_chatbot)]
+
+
+def get_job_queue(connection: HTTPConnection) -> JobQueue:
+    """Dependency for getting the chat job queue started with the chatbot"""
+    return connection.app.state.jobs
+
+
+JobQueueDependency = Annotated[JobQueue, Depends(get_job_queue)]
@@ -1,19 +1,58 @@
-from fastapi import APIRouter, HTTPException
+from collections.abc import AsyncIterator
+from uuid import UUID
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, WebSocketException, status
+from fastapi.responses import StreamingResponse
 from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.api.dependencies import CurrentUser, SessionDependency
-from app.chatbot.chatbot_core import Chatbot
-from app.models import ChatHistory, ChatHistoryRequest, Thread, ThreadCreate, UserMessage
+from app.api.dependencies import (
+    ChatbotDependency,
+    CurrentUser,
+    JobQueueDependency,
+    SessionDependency,
+    WebSocketUser,
+)
+from app.chatbot.jobs import Job, JobQueueFullError
+from app.chatbot.utils import format_sse_event
+from app.models import ChatHistory, ChatHistoryRequest, ChatJob, Thread, ThreadCreate, User, UserMessage
 
 router = APIRouter(prefix="/chatbot", tags=["chatbot"])
-chatbot = Chatbot()
+
+
+async def get_or_create_thread_id(session: AsyncSession, user: User, thread_id: UUID | None) -> UUID:
+    """
+    Return the given thread ID, creating a new thread for the user if none was given.
+    Raises a 404 if the thread does not exist or belongs to another user: the conversation state of a thread
+    without a row in the application database would be deleted by the checkpoint compaction.
+    """
+    if thread_id is not None:
+        if not await get_user_thread(session, user, thread_id):
+            raise HTTPException(status_code=404, detail="Thread not found.")
+        return thread_id
+    thread = Thread.model_validate(ThreadCreate(title="New Thread"), update={"user_id": user.id})
+    session.add(thread)
+    await session.commit()
+    await session.refresh(thread)
+    return thread.id
+
+
+async def get_user_thread(session: AsyncSession, user: User, thread_id: UUID) -> Thread | None:
+    """Return the thread with the given ID if it belongs to the user."""
+    statement = select(Thread).where(Thread.id == thread_id, Thread.user_id == user.id)
+    return (await session.exec(statement)).first()
+
+
+def public_job(job: Job) -> ChatJob:
+    return ChatJob(id=job.id, thread_id=job.thread_id, status=job.status, response=job.response, error=job.error)
 
 
 @router.post("/chat", summary="Send a message to the chatbot")
-def chat_endpoint(
+async def chat_endpoint(
     user_message: UserMessage,
     session: SessionDependency,
     current_user: CurrentUser,
+    chatbot: ChatbotDependency,
 ):
     """
     Send a message to the chatbot and receive a response.
@@ -25,39 +64,73 @@ def chat_endpoint(
         The response from the chatbot, with Markdown converted to HTML.
 
     Raises:
-        HTTPException: If there's an error processing the message.
+        HTTPException: 404 if the thread is not one of the user's, or if there's an error processing the message.
     """
     try:
-        thread_id = user_message.thread_id
-        if thread_id is None:
-            # Create a new thread for the user
-            thread = Thread.model_validate(ThreadCreate(title="New Thread"), update={"user_id": current_user.id})
-            session.add(thread)
-            session.commit()
-            session.refresh(thread)
-            thread_id = thread.id
-
-        response = chatbot.process_message(user_message.content, str(thread_id))
+        thread_id = await get_or_create_thread_id(session, current_user, user_message.thread_id)
+        response = await chatbot.process_message(user_message.content, str(thread_id))
 
         return {"response": response, "thread_id": str(thread_id)}
+    except HTTPException as http_error:
+        raise http_error
     except Exception as error:
         raise HTTPException(status_code=500, detail=str(error))
 
 
+@router.post("/chat/stream", summary="Stream the chatbot response")
+async def chat_stream_endpoint(
+    user_message: UserMessage,
+    session: SessionDependency,
+    current_user: CurrentUser,
+    chatbot: ChatbotDependency,
+) -> StreamingResponse:
+    """
+    Send a message to the chatbot and stream its response as Server-Sent Events.
+
+    Args:
+        user_message: The message from the user, including thread ID.
+
+    Returns:
+        A `text/event-stream` response emitting, in order, a `thread` event with the thread ID,
+        `token`, `tool_start` and `tool_end` events while the agent works, and a final `message`
+        event with the response converted to HTML. Failures are reported as an `error` event.
+
+    Raises:
+        HTTPException: 404 if the thread is not one of the user's.
+    """
+    thread_id = await get_or_create_thread_id(session, current_user, user_message.thread_id)
+
+    async def event_stream() -> AsyncIterator[str]:
+        yield format_sse_event("thread", {"thread_id": str(thread_id)})
+        try:
+            async for event in chatbot.stream_message(user_message.content, str(thread_id)):
+                yield format_sse_event(event["event"], event["data"])
+        except Exception as error:
+            yield format_sse_event("error", {"detail": str(error)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/chat-history", summary="Get chat history")
-def chat_history_endpoint(
+async def chat_history_endpoint(
     request: ChatHistoryRequest,
     session: SessionDependency,
     current_user: CurrentUser,
+    chatbot: ChatbotDependency,
 ):
     """
-    Retrieve the chat history for a specific thread.
+    Retrieve the chat history for a specific thread, optionally one page at a time.
 
     Args:
-        request: The request containing the thread ID.
+        request: The request containing the thread ID and the optional `before`/`limit` cursor.
 
     Returns:
-        The chat history for the specified thread.
+        The chat history for the specified thread. When older messages remain,
+        `next_cursor` holds the value to pass as `before` to fetch the previous page.
 
     Raises:
         HTTPException: If there's an error retrieving the chat history.
@@ -67,13 +140,76 @@ def chat_history_endpoint(
             raise HTTPException(status_code=400, detail="Thread ID is required.")
 
         thread_id = request.thread_id
-        statement = select(Thread).where(Thread.id == thread_id, Thread.user_id == current_user.id)
-        thread = session.exec(statement).first()
+        thread = await get_user_thread(session, current_user, thread_id)
         if not thread:
             raise HTTPException(status_code=404, detail="Thread not found.")
-        chat_history = chatbot.get_chat_history(str(thread_id))
-        return ChatHistory(thread_id=thread_id, messages=chat_history)
+        chat_history, has_more = await chatbot.get_chat_history(str(thread_id), request.before, request.limit)
+        next_cursor = chat_history[0].id if has_more else None
+        return ChatHistory(thread_id=thread_id, messages=chat_history, next_cursor=next_cursor)
     except HTTPException as http_error:
         raise http_error
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
     except Exception:
         raise HTTPException(status_code=500, detail="An unexpected error occurred.")
+
+
+@router.post("/jobs", summary="Queue a message for the chatbot", status_code=202)
+async def create_chat_job(
+    user_message: UserMessage,
+    session: SessionDependency,
+    current_user: CurrentUser,
+    jobs: JobQueueDependency,
+) -> ChatJob:
+    """
+    Queue a message for the chatbot and return at once, without waiting for the response.
+
+    Args:
+        user_message: The message from the user, including thread ID.
+
+    Returns:
+        The queued job. Its response is available by polling `GET /chatbot/jobs/{job_id}`,
+        or pushed over the `/chatbot/jobs/{job_id}/ws` WebSocket.
+
+    Raises:
+        HTTPException: 404 if the thread is not one of the user's, 429 if the user already has as many jobs
+            queued or running as allowed.
+    """
+    thread_id = await get_or_create_thread_id(session, current_user, user_message.thread_id)
+    try:
+        job = await jobs.submit(current_user.id, str(thread_id), user_message.content)
+    except JobQueueFullError as error:
+        raise HTTPException(status_code=429, detail=str(error))
+    return public_job(job)
+
+
+@router.get("/jobs/{job_id}", summary="Get a chatbot job")
+async def read_chat_job(job_id: UUID, current_user: CurrentUser, jobs: JobQueueDependency) -> ChatJob:
+    """
+    Get the status of a chatbot job, with the response once it is done.
+    Finished jobs can be polled for a limited time, after which they are not found anymore.
+    """
+    job = jobs.get(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return public_job(job)
+
+
+@router.websocket("/jobs/{job_id}/ws")
+async def chat_job_websocket(
+    websocket: WebSocket, job_id: UUID, current_user: WebSocketUser, jobs: JobQueueDependency
+) -> None:
+    """
+    Follow a chatbot job, authenticated with the access token as the `token` query parameter.
+    Sends the job as JSON on connection and whenever its status changes, and closes once the job finished.
+    """
+    job = jobs.get(job_id)
+    if not job or job.user_id != current_user.id:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason="Job not found")
+    await websocket.accept()
+    try:
+        async for _ in job.watch():
+            await websocket.send_json(public_job(job).model_dump(mode="json"))
+    except WebSocketDisconnect:
+        return
+    await websocket.close()
@@ -7,8 +7,9 @@ from fastapi.security import OAuth2PasswordRequestForm
 from app import crud
 from app.api.dependencies import CurrentUser, SessionDependency
 from app.core import security
+from app.core.auth_cache import invalidate_user
 from app.core.config import settings
-from app.core.security import get_password_hash
+from app.core.security import aget_password_hash
 from app.models import NewPassword, Response, Token, UserPublic
 from app.utils import (
     verify_password_reset_token,
@@ -18,11 +19,13 @@ router = APIRouter(tags=["login"])
 
 
 @router.post("/login/access-token")
-def login_access_token(session: SessionDependency, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]) -> Token:
+async def login_access_token(
+    session: SessionDependency, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.authenticate(session=session, email=form_data.username, password=form_data.password)
+    user = await crud.authenticate(session=session, email=form_data.username, password=form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect email or password")
     elif not user.is_active:
@@ -32,7 +35,7 @@ def login_access_token(session: SessionDependency, form_data: Annotated[OAuth2Pa
 
 
 @router.post("/login/test-token", response_model=UserPublic)
-def test_token(current_user: CurrentUser) -> Any:
+async def test_token(current_user: CurrentUser) -> Any:
     """
     Test access token
     """
@@ -40,11 +43,11 @@ def test_token(current_user: CurrentUser) -> Any:
 
 
 @router.post("/password-recovery/{email}")
-def recover_password(email: str, session: SessionDependency) -> Response:
+async def recover_password(email: str, session: SessionDependency) -> Response:
     """
     Password Recovery
     """
-    user = crud.get_user_by_email(session=session, email=email)
+    user = await crud.get_user_by_email(session=session, email=email)
 
     if not user:
         raise HTTPException(
@@ -55,14 +58,14 @@ def recover_password(email: str, session: SessionDependency) -> Response:
 
 
 @router.post("/reset-password/")
-def reset_password(session: SessionDependency, body: NewPassword) -> Response:
+async def reset_password(session: SessionDependency, body: NewPassword) -> Response:
     """
     Reset password
     """
     email = verify_password_reset_token(token=body.token)
     if not email:
         raise HTTPException(status_code=400, detail="Invalid token")
-    user = crud.get_user_by_email(session=session, email=email)
+    user = await crud.get_user_by_email(session=session, email=email)
     if not user:
         raise HTTPException(
             status_code=404,
@@ -70,8 +73,9 @@ def reset_password(session: SessionDependency, body: NewPassword) -> Response:
         )
     elif not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    hashed_password = get_password_hash(password=body.new_password)
+    hashed_password = await aget_password_hash(body.new_password)
     user.hashed_password = hashed_password
     session.add(user)
-    session.commit()
+    await session.commit()
+    invalidate_user(user.id)
     return Response(message="Password updated successfully")
@@ -2,46 +2,58 @@ import uuid
 from typing import Any
 
 from fastapi import APIRouter, HTTPException
+from sqlalchemy import tuple_
 from sqlmodel import col, func, select
 
-from app.api.dependencies import CurrentUser, SessionDependency
+from app.api.dependencies import ChatbotDependency, CurrentUser, SessionDependency
 from app.models import Response, Thread, ThreadCreate, ThreadPublic, ThreadsPublic, ThreadUpdate
 
 router = APIRouter(prefix="/threads", tags=["threads"])
 
 
 @router.get("/", response_model=ThreadsPublic)
-def read_threads(session: SessionDependency, current_user: CurrentUser, skip: int = 0, limit: int = 100) -> Any:
+async def read_threads(
+    session: SessionDependency,
+    current_user: CurrentUser,
+    skip: int = 0,
+    limit: int = 100,
+    before: uuid.UUID | None = None,
+    include_count: bool = True,
+) -> Any:
     """
-    Retrieve threads.
+    Retrieve threads, newest first.
+
+    Pass the `next_cursor` of a page as `before` to fetch the next one, which unlike `skip` stays fast on deep
+    pages. The total count needs a pass over the threads and can be left out with `include_count=false`.
     """
+    statement = select(Thread)
+    count_statement = select(func.count()).select_from(Thread)
+    if not current_user.is_superuser:
+        statement = statement.where(Thread.user_id == current_user.id)
+        count_statement = count_statement.where(Thread.user_id == current_user.id)
+
+    if before is not None:
+        cursor = await session.get(Thread, before)
+        if not cursor or (not current_user.is_superuser and cursor.user_id != current_user.id):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # Compared to the stored values, the cursor thread is excluded even if its timestamp round-trips differently
+        cursor_key = select(Thread.created_at, Thread.id).where(Thread.id == before).scalar_subquery()
+        statement = statement.where(tuple_(col(Thread.created_at), col(Thread.id)) < cursor_key)
+
+    statement = statement.order_by(col(Thread.created_at).desc(), col(Thread.id).desc()).offset(skip).limit(limit + 1)
+    threads = (await session.exec(statement)).all()
+    next_cursor = str(threads[limit - 1].id) if 0 < limit < len(threads) else None
+    count = (await session.exec(count_statement)).one() if include_count else None
 
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Thread)
-        count = session.exec(count_statement).one()
-        statement = select(Thread).order_by(col(Thread.created_at).desc()).offset(skip).limit(limit)
-        threads = session.exec(statement).all()
-    else:
-        count_statement = select(func.count()).select_from(Thread).where(Thread.user_id == current_user.id)
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Thread)
-            .where(Thread.user_id == current_user.id)
-            .order_by(col(Thread.created_at).desc())
-            .offset(skip)
-            .limit(limit)
-        )
-        threads = session.exec(statement).all()
-
-    return ThreadsPublic(data=threads, count=count)
+    return ThreadsPublic(data=threads[:limit], count=count, next_cursor=next_cursor)
 
 
 @router.get("/{id}", response_model=ThreadPublic)
-def read_thread(session: SessionDependency, current_user: CurrentUser, id: uuid.UUID) -> Any:
+async def read_thread(session: SessionDependency, current_user: CurrentUser, id: uuid.UUID) -> Any:
     """
     Get thread by ID.
     """
-    thread = session.get(Thread, id)
+    thread = await session.get(Thread, id)
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
     if not current_user.is_superuser and (thread.user_id != current_user.id):
@@ -50,19 +62,19 @@ def read_thread(session: SessionDependency, current_user: CurrentUser, id: uuid.
 
 
 @router.post("/", response_model=ThreadPublic)
-def create_thread(*, session: SessionDependency, current_user: CurrentUser, thread_in: ThreadCreate) -> Any:
+async def create_thread(*, session: SessionDependency, current_user: CurrentUser, thread_in: ThreadCreate) -> Any:
     """
     Create new thread.
     """
     thread = Thread.model_validate(thread_in, update={"user_id": current_user.id})
     session.add(thread)
-    session.commit()
-    session.refresh(thread)
+    await session.commit()
+    await session.refresh(thread)
     return thread
 
 
 @router.put("/{id}", response_model=ThreadPublic)
-def update_thread(
+async def update_thread(
     *,
     session: SessionDependency,
     current_user: CurrentUser,
@@ -72,7 +84,7 @@ def update_thread(
     """
     Update an thread.
     """
-    thread = session.get(Thread, id)
+    thread = await session.get(Thread, id)
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
     if not current_user.is_superuser and (thread.user_id != current_user.id):
@@ -80,21 +92,24 @@ def update_thread(
     update_dict = thread_in.model_dump(exclude_unset=True)
     thread.sqlmodel_update(update_dict)
     session.add(thread)
-    session.commit()
-    session.refresh(thread)
+    await session.commit()
+    await session.refresh(thread)
     return thread
 
 
 @router.delete("/{id}")
-def delete_thread(session: SessionDependency, current_user: CurrentUser, id: uuid.UUID) -> Response:
+async def delete_thread(
+    session: SessionDependency, current_user: CurrentUser, chatbot: ChatbotDependency, id: uuid.UUID
+) -> Response:
     """
-    Delete an thread.
+    Delete an thread, with its conversation state.
     """
-    thread = session.get(Thread, id)
+    thread = await session.get(Thread, id)
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
     if not current_user.is_superuser and (thread.user_id != current_user.id):
         raise HTTPException(status_code=400, detail="Not enough permissions")
-    session.delete(thread)
-    session.commit()
+    await session.delete(thread)
+    await session.commit()
+    await chatbot.delete_threads([str(id)])
     return Response(message="Thread deleted successfully")
@@ -6,11 +6,13 @@ from sqlmodel import col, delete, func, select
 
 from app import crud
 from app.api.dependencies import (
+    ChatbotDependency,
     CurrentUser,
     SessionDependency,
     get_current_active_superuser,
 )
-from app.core.security import get_password_hash, verify_password
+from app.core.auth_cache import invalidate_user
+from app.core.security import aget_password_hash, averify_password
 from app.models import (
     Response,
     Thread,
@@ -32,72 +34,77 @@ router = APIRouter(prefix="/users", tags=["users"])
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDependency, skip: int = 0, limit: int = 100) -> Any:
+async def read_users(session: SessionDependency, skip: int = 0, limit: int = 100) -> Any:
     """
     Retrieve users.
     """
 
     count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
+    count = (await session.exec(count_statement)).one()
 
     statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    users = (await session.exec(statement)).all()
 
     return UsersPublic(data=users, count=count)
 
 
 @router.post("/", dependencies=[Depends(get_current_active_superuser)], response_model=UserPublic)
-def create_user(*, session: SessionDependency, user_in: UserCreate) -> Any:
+async def create_user(*, session: SessionDependency, user_in: UserCreate) -> Any:
     """
     Create new user.
     """
-    user = crud.get_user_by_email(session=session, email=user_in.email)
+    user = await crud.get_user_by_email(session=session, email=user_in.email)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system.",
         )
 
-    user = crud.create_user(session=session, user_create=user_in)
+    user = await crud.create_user(session=session, user_create=user_in)
     return user
 
 
 @router.patch("/me", response_model=UserPublic)
-def update_user_me(*, session: SessionDependency, user_in: UserUpdateMe, current_user: CurrentUser) -> Any:
+async def update_user_me(*, session: SessionDependency, user_in: UserUpdateMe, current_user: CurrentUser) -> Any:
     """
     Update own user.
     """
 
     if user_in.email:
-        existing_user = crud.get_user_by_email(session=session, email=user_in.email)
+        existing_user = await crud.get_user_by_email(session=session, email=user_in.email)
         if existing_user and existing_user.id != current_user.id:
             raise HTTPException(status_code=409, detail="User with this email already exists")
     user_data = user_in.model_dump(exclude_unset=True)
-    current_user.sqlmodel_update(user_data)
-    session.add(current_user)
-    session.commit()
-    session.refresh(current_user)
-    return current_user
+    # The current user may come from the authentication cache, so the user is loaded to be modified
+    db_user = await session.get(User, current_user.id)
+    db_user.sqlmodel_update(user_data)
+    session.add(db_user)
+    await session.commit()
+    invalidate_user(db_user.id)
+    await session.refresh(db_user)
+    return db_user
 
 
 @router.patch("/me/password", response_model=Response)
-def update_password_me(*, session: SessionDependency, body: UpdatePassword, current_user: CurrentUser) -> Any:
+async def update_password_me(*, session: SessionDependency, body: UpdatePassword, current_user: CurrentUser) -> Any:
     """
     Update own password.
     """
-    if not verify_password(body.current_password, current_user.hashed_password):
+    db_user = await session.get(User, current_user.id)
+    if not await averify_password(body.current_password, db_user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect password")
     if body.current_password == body.new_password:
         raise HTTPException(status_code=400, detail="New password cannot be the same as the current one")
-    hashed_password = get_password_hash(body.new_password)
-    current_user.hashed_password = hashed_password
-    session.add(current_user)
-    session.commit()
+    hashed_password = await aget_password_hash(body.new_password)
+    db_user.hashed_password = hashed_password
+    session.add(db_user)
+    await session.commit()
+    invalidate_user(db_user.id)
     return Response(message="Password updated successfully")
 
 
 @router.get("/me", response_model=UserPublic)
-def read_user_me(current_user: CurrentUser) -> Any:
+async def read_user_me(current_user: CurrentUser) -> Any:
     """
     Get current user.
     """
@@ -105,39 +112,45 @@ def read_user_me(current_user: CurrentUser) -> Any:
 
 
 @router.delete("/me", response_model=Response)
-def delete_user_me(session: SessionDependency, current_user: CurrentUser) -> Any:
+async def delete_user_me(session: SessionDependency, current_user: CurrentUser, chatbot: ChatbotDependency) -> Any:
     """
-    Delete own user.
+    Delete own user, with the conversation state of their threads.
     """
     if current_user.is_superuser:
         raise HTTPException(status_code=403, detail="Super users are not allowed to delete themselves")
-    session.delete(current_user)
-    session.commit()
+    db_user = await session.get(User, current_user.id)
+    thread_ids = [
+        str(thread_id) for thread_id in await session.exec(select(Thread.id).where(Thread.user_id == db_user.id))
+    ]
+    await session.delete(db_user)
+    await session.commit()
+    invalidate_user(db_user.id)
+    await chatbot.delete_threads(thread_ids)
     return Response(message="User deleted successfully")
 
 
 @router.post("/signup", response_model=UserPublic)
-def register_user(session: SessionDependency, user_in: UserRegister) -> Any:
+async def register_user(session: SessionDependency, user_in: UserRegister) -> Any:
     """
     Create new user without the need to be logged in.
     """
-    user = crud.get_user_by_email(session=session, email=user_in.email)
+    user = await crud.get_user_by_email(session=session, email=user_in.email)
     if user:
         raise HTTPException(
             status_code=400,
             detail="The user with this email already exists in the system",
         )
     user_create = UserCreate.model_validate(user_in)
-    user = crud.create_user(session=session, user_create=user_create)
+    user = await crud.create_user(session=session, user_create=user_create)
     return user
 
 
 @router.get("/{user_id}", response_model=UserPublic)
-def read_user_by_id(user_id: uuid.UUID, session: SessionDependency, current_user: CurrentUser) -> Any:
+async def read_user_by_id(user_id: uuid.UUID, session: SessionDependency, current_user: CurrentUser) -> Any:
     """
     Get a specific user by id.
     """
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     if user == current_user:
         return user
     if not current_user.is_superuser:
@@ -153,7 +166,7 @@ def read_user_by_id(user_id: uuid.UUID, session: SessionDependency, current_user
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UserPublic,
 )
-def update_user(
+async def update_user(
     *,
     session: SessionDependency,
     user_id: uuid.UUID,
@@ -163,33 +176,40 @@ def update_user(
     Update a user.
     """
 
-    db_user = session.get(User, user_id)
+    db_user = await session.get(User, user_id)
     if not db_user:
         raise HTTPException(
             status_code=404,
             detail="The user with this id does not exist in the system",
         )
     if user_in.email:
-        existing_user = crud.get_user_by_email(session=session, email=user_in.email)
+        existing_user = await crud.get_user_by_email(session=session, email=user_in.email)
         if existing_user and existing_user.id != user_id:
             raise HTTPException(status_code=409, detail="User with this email already exists")
 
-    db_user = crud.update_user(session=session, db_user=db_user, user_in=user_in)
+    db_user = await crud.update_user(session=session, db_user=db_user, user_in=user_in)
     return db_user
 
 
 @router.delete("/{user_id}", dependencies=[Depends(get_current_active_superuser)])
-def delete_user(session: SessionDependency, current_user: CurrentUser, user_id: uuid.UUID) -> Response:
+async def delete_user(
+    session: SessionDependency, current_user: CurrentUser, chatbot: ChatbotDependency, user_id: uuid.UUID
+) -> Response:
     """
-    Delete a user.
+    Delete a user, with the conversation state of their threads.
     """
-    user = session.get(User, user_id)
+    user = await session.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if user == current_user:
         raise HTTPException(status_code=403, detail="Super users are not allowed to delete themselves")
+    thread_ids = [
+        str(thread_id) for thread_id in await session.exec(select(Thread.id).where(Thread.user_id == user_id))
+    ]
     statement = delete(Thread).where(col(Thread.user_id) == user_id)
-    session.exec(statement)  # type: ignore
-    session.delete(user)
-    session.commit()
+    await session.exec(statement)  # type: ignore
+    await session.delete(user)
+    await session.commit()
+    invalidate_user(user_id)
+    await chatbot.delete_threads(thread_ids)
     return Response(message="User deleted successfully")
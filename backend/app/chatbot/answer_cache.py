@@ -0,0 +1,105 @@
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+
+from app.chatbot.sql_cache import DataVersionMonitor
+from app.core.cache import LRUCache
+from app.core.config import settings
+
+# Words that carry no meaning of their own for matching questions
+STOPWORDS = frozenset(
+    "a an the is are was were be there of in on at for to from by with please me show tell give list find "
+    "do does did can could would you i we what which في من على عن إلى الى ما ماذا هل كم".split()
+)
+
+
+def normalize_question(question: str) -> str:
+    """Casefold, drop punctuation and collapse whitespace."""
+    question = unicodedata.normalize("NFKC", question).casefold()
+    return " ".join(re.sub(r"[^\w\s]", " ", question).split())
+
+
+@dataclass(frozen=True)
+class QuestionKey:
+    """Lexical fingerprint of a question: its keywords, their character trigrams and its numbers."""
+
+    keywords: str
+    trigrams: frozenset[str]
+    numbers: frozenset[str]
+
+    @classmethod
+    def from_question(cls, question: str) -> "QuestionKey":
+        words = normalize_question(question).split()
+        keywords = " ".join(word for word in words if word not in STOPWORDS)
+        padded = f" {keywords} "
+        return cls(
+            keywords=keywords,
+            trigrams=frozenset(padded[index : index + 3] for index in range(len(padded) - 2)),
+            numbers=frozenset(word for word in words if word.isdigit()),
+        )
+
+    def similarity(self, other: "QuestionKey") -> float:
+        """Jaccard similarity of the keyword trigrams, 0 when the questions mention different numbers."""
+        if self.numbers != other.numbers or not self.trigrams or not other.trigrams:
+            return 0.0
+        return len(self.trigrams & other.trigrams) / len(self.trigrams | other.trigrams)
+
+
+class AnswerCache:
+    """
+    Size-bounded LRU of chatbot answers, matched on the lexical similarity of the questions.
+    Shared by all users, so it only holds answers to the first question of a thread, which cannot
+    depend on an earlier turn of the conversation.
+
+    A question hits the cache when its keywords are identical to those of a cached question,
+    or close enough to reach the similarity threshold. The whole cache is dropped as soon as
+    the chatbot database reports a new data version, like `QueryResultCache`.
+    """
+
+    def __init__(
+        self,
+        monitor: DataVersionMonitor,
+        max_size: int = settings.answer_cache_size,
+        threshold: float = settings.answer_cache_threshold,
+    ):
+        self.monitor = monitor
+        self.threshold = threshold
+        self.answers: LRUCache[str, tuple[QuestionKey, str]] = LRUCache(max_size)
+        self.version: tuple[int, int] | None = None
+        self.similar_hits = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, question: str) -> tuple[tuple[int, int], str | None]:
+        """
+        Return the current data version and the cached answer to the closest question, if any.
+        Pass the version back to `store` so answers computed on stale data are not cached.
+        """
+        version = self.monitor.data_version()
+        with self._lock:
+            if version != self.version:
+                self.answers.clear()
+                self.version = version
+        key = QuestionKey.from_question(question)
+        if (exact := self.answers.get(key.keywords)) is not None:
+            return version, exact[1]
+        best_keywords, best_answer, best_score = None, None, self.threshold
+        for keywords, (candidate, answer) in self.answers.items():
+            if (score := key.similarity(candidate)) >= best_score:
+                best_keywords, best_answer, best_score = keywords, answer, score
+        if best_keywords is not None:
+            # Counted as a miss of the exact keywords above, similar hits have their own counter
+            self.answers.touch(best_keywords)
+            self.similar_hits += 1
+        return version, best_answer
+
+    def store(self, question: str, version: tuple[int, int], answer: str) -> None:
+        key = QuestionKey.from_question(question)
+        if not key.keywords:
+            return
+        with self._lock:
+            if version == self.version:
+                self.answers.set(key.keywords, (key, answer))
+
+    def stats(self) -> dict[str, int]:
+        return {**self.answers.stats(), "similar_hits": self.similar_hits}
@@ -1,90 +1,290 @@
-from langchain_core.messages import AIMessage, HumanMessage
+import asyncio
+from collections.abc import AsyncIterator, Sequence
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
 from langgraph.prebuilt import create_react_agent
 
-from app.chatbot.memory import memory
-from app.chatbot.model import model
+from app.chatbot.answer_cache import AnswerCache
+from app.chatbot.context import ChatbotState, ContextWindow
+from app.chatbot.memory import PooledSqliteSaver, open_memory
+from app.chatbot.model import fast_model, model
 from app.chatbot.prompt import system_message
-from app.chatbot.tools import tools
-from app.chatbot.utils import render_markdown_to_html
+from app.chatbot.render_cache import RenderCache, open_render_cache
+from app.chatbot.scheduler import TurnScheduler
+from app.chatbot.tools import database_monitor, engine, schema_catalog, search_tool, tools
+from app.chatbot.utils import message_text
+from app.core.config import create_app_data_dir, settings
 from app.models import Message
 
 
+def tool_events(message: BaseMessage) -> list[dict[str, Any]]:
+    """
+    Build the `tool_start` events for the tool calls requested by an AI message,
+    or the `tool_end` event for a tool message.
+    """
+    if isinstance(message, AIMessage):
+        return [
+            {
+                "event": "tool_start",
+                "data": {"id": tool_call["id"], "name": tool_call["name"], "args": tool_call["args"]},
+            }
+            for tool_call in message.tool_calls
+        ]
+    if isinstance(message, ToolMessage):
+        return [
+            {
+                "event": "tool_end",
+                "data": {"id": message.tool_call_id, "name": message.name, "status": message.status},
+            }
+        ]
+    return []
+
+
+def message_role(message: BaseMessage) -> str | None:
+    """
+    Return the role a message is shown with in the chat history,
+    or None for messages that are not shown (tool calls and tool results).
+    """
+    if isinstance(message, HumanMessage):
+        return "human"
+    if isinstance(message, AIMessage) and not message.tool_calls:
+        return "ai"
+    return None
+
+
+def is_reusable_answer(turn: Sequence[BaseMessage]) -> bool:
+    """
+    Whether the messages produced for a question end in an answer that can be given again to the same question:
+    no tool failed and the answer does not rely on web search results, which change independently of the database.
+    """
+    for message in turn:
+        if isinstance(message, ToolMessage) and (message.status == "error" or message.name == search_tool.name):
+            return False
+    return bool(turn) and message_role(turn[-1]) == "ai" and bool(message_text(turn[-1].content))
+
+
 class Chatbot:
     """Encapsulates the chatbot functionality."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        memory: PooledSqliteSaver,
+        render_cache: RenderCache | None = None,
+        answer_cache: AnswerCache | None = None,
+    ):
         self.memory = memory
+        self.render_cache = render_cache or RenderCache()
+        self.answer_cache = answer_cache or AnswerCache(database_monitor)
+        self.scheduler = TurnScheduler()
         self.model = model
         self.tools = tools
+        self.context_window = ContextWindow(fast_model)
         self.agent = create_react_agent(
-            model=self.model, tools=self.tools, checkpointer=self.memory, prompt=system_message
+            model=self.model,
+            tools=self.tools,
+            checkpointer=self.memory,
+            prompt=system_message,
+            pre_model_hook=self.context_window.as_runnable(),
+            state_schema=ChatbotState,
         )
 
-    def stream_graph_updates(self, user_input: str, thread_id: str) -> None:
+    async def warm_up(self) -> None:
+        """
+        Do the one-off work of the first request upfront: build the schema catalog, open a connection
+        to the chatbot database and read the data version the query and answer caches are checked against.
+        """
+        await asyncio.to_thread(schema_catalog.refresh)
+        await asyncio.to_thread(self.answer_cache.monitor.data_version)
+        await asyncio.to_thread(lambda: engine.connect().close())
+
+    async def stream_graph_updates(self, user_input: str, thread_id: str) -> None:
         """
         Stream chatbot responses for a given user input and thread.
         Prints each message as it is generated.
         """
         config = {"configurable": {"thread_id": thread_id}}
-        for event in self.agent.stream(
+        async for event in self.agent.astream(
             {"messages": [{"role": "user", "content": user_input}]}, config, stream_mode="values"
         ):
             event["messages"][-1].pretty_print()
 
-    def process_message(self, message: str, thread_id: str) -> str:
+    async def lookup_answer(self, message: str, config: dict[str, Any]) -> tuple[tuple[int, int] | None, str | None]:
         """
-        Process a user message and return the chatbot's response as HTML.
+        Look up a cached answer to the message, for the first turn of a thread only: a later message may refer
+        to the conversation ("what is my name?", "sort them by price"), and its answer to that conversation must
+        neither be served to other threads nor come from them. Returns the data version to store the answer with
+        (None if the message cannot be answered from the cache) and the cached answer, if any.
+        """
+        state = await self.agent.aget_state(config)
+        if state.values.get("messages"):
+            return None, None
+        return await asyncio.to_thread(self.answer_cache.lookup, message)
+
+    async def save_cached_answer(self, message: str, answer: str, config: dict[str, Any]) -> AIMessage:
+        """Record the question and its cached answer in the thread, as if the agent had answered it."""
+        answer_message = AIMessage(content=answer, id=str(uuid4()))
+        await self.agent.aupdate_state(
+            config,
+            {"messages": [HumanMessage(content=message, id=str(uuid4())), answer_message]},
+            as_node="agent",
+        )
+        return answer_message
+
+    async def stream_agent(
+        self, message: str, config: dict[str, Any], turn: list[BaseMessage]
+    ) -> AsyncIterator[dict[str, Any]]:
+        """
+        Run the agent on a user message, yielding the `token` and `tool_start`/`tool_end` events
+        and collecting the messages it produces into `turn`.
+        """
+        async for mode, chunk in self.agent.astream(
+            {"messages": [{"role": "user", "content": message}]}, config, stream_mode=["messages", "updates"]
+        ):
+            if mode == "messages":
+                message_chunk, metadata = chunk
+                if isinstance(message_chunk, AIMessageChunk) and metadata.get("langgraph_node") == "agent":
+                    if token := message_text(message_chunk.content):
+                        yield {"event": "token", "data": {"content": token}}
+                continue
+
+            for node_update in chunk.values():
+                for update_message in (node_update or {}).get("messages", []):
+                    turn.append(update_message)
+                    for event in tool_events(update_message):
+                        yield event
+
+    async def stream_message(self, message: str, thread_id: str) -> AsyncIterator[dict[str, Any]]:
+        """
+        Stream the chatbot's work on a user message as a sequence of events.
+        Yields `token` events for each LLM chunk, `tool_start`/`tool_end` events around
+        every tool call and a final `message` event holding the answer rendered as HTML.
+        A cached answer is sent as a single `token` event followed by the `message` event.
+
+        Turns of a thread run one after the other, and a message sent again while it is still being
+        answered on the thread receives the events of the turn in flight rather than a second answer.
         """
+        turn = self.scheduler.submit(thread_id, message, partial(self.run_turn, message, thread_id))
+        async for event in turn.subscribe():
+            yield event
+
+    async def run_turn(self, message: str, thread_id: str) -> AsyncIterator[dict[str, Any]]:
+        """Answer a user message on the thread, see `stream_message`. Only called through the scheduler."""
         config = {"configurable": {"thread_id": thread_id}}
-        response = self.agent.invoke({"messages": [{"role": "user", "content": message}]}, config)
-        response_message = response["messages"][-1].content
-        return render_markdown_to_html(response_message)
+        version, answer = await self.lookup_answer(message, config)
+        if answer is not None:
+            answer_message = await self.save_cached_answer(message, answer, config)
+            yield {"event": "token", "data": {"content": answer}}
+            yield {"event": "message", "data": {"content": await self.render_cache.render(answer_message.id, answer)}}
+            return
+
+        turn: list[BaseMessage] = []
+        async for event in self.stream_agent(message, config, turn):
+            yield event
 
-    def get_chat_history(self, thread_id: str) -> list[Message]:
+        final_message = next(
+            (item for item in reversed(turn) if isinstance(item, AIMessage) and not item.tool_calls),
+            AIMessage(content=""),
+        )
+        if version is not None and is_reusable_answer(turn):
+            self.answer_cache.store(message, version, message_text(final_message.content))
+        content = await self.render_cache.render(final_message.id, message_text(final_message.content))
+        yield {"event": "message", "data": {"content": content}}
+
+    async def process_message(self, message: str, thread_id: str) -> str:
         """
-        Retrieve the chat history for a given thread ID.
-        Returns a list of messages
+        Process a user message and return the chatbot's response as HTML.
+        Repeated questions are answered from the answer cache without calling the model.
+        Shares the turns of `stream_message`, so both endpoints are serialized and coalesced together.
+        """
+        content = ""
+        async for event in self.stream_message(message, thread_id):
+            if event["event"] == "message":
+                content = event["data"]["content"]
+        return content
+
+    async def delete_threads(self, thread_ids: Sequence[str]) -> None:
+        """Delete the conversation state of deleted threads."""
+        await self.memory.adelete_threads(thread_ids)
+
+    async def get_chat_history(
+        self, thread_id: str, before: str | None = None, limit: int | None = None
+    ) -> tuple[list[Message], bool]:
+        """
+        Retrieve a page of the chat history for a given thread ID.
+        Returns up to `limit` messages older than the message `before` (the latest ones if not given),
+        oldest first, and whether there are older messages left.
+        Only the messages in the page are rendered to HTML, through the render cache.
         """
         config = {"configurable": {"thread_id": thread_id}}
-        messages = self.agent.get_state(config).values.get("messages")
-        chat_history = []
-        if not messages:
-            return chat_history
-        for message in messages:
-            role = None
-            message_content = message.content
-            if isinstance(message, HumanMessage):
-                role = "human"
-            elif isinstance(message, AIMessage):
-                role = "ai"
-                # if message.tool_calls and not message_content and not message_content.strip():
-                if message.tool_calls:
-                    continue
-            else:
-                # Handle other message types if necessary
+        state = await self.agent.aget_state(config)
+        messages = state.values.get("messages") or []
+        end = len(messages)
+        if before is not None:
+            end = next((index for index in range(end - 1, -1, -1) if messages[index].id == before), None)
+            if end is None:
+                raise ValueError(f"Message {before} not found in thread {thread_id}")
+
+        window = []
+        has_more = False
+        for index in range(end - 1, -1, -1):
+            message = messages[index]
+            role = message_role(message)
+            if role is None:
                 continue
+            if limit is not None and len(window) == limit:
+                has_more = True
+                break
+            window.append((message, role))
+        window.reverse()
 
-            message_content = render_markdown_to_html(message_content)
-            chat_history.append(Message(role=role, content=message_content))
-        return chat_history
+        rendered = await self.render_cache.render_many([(message.id, message.content) for message, _ in window])
+        chat_history = [
+            Message(id=message.id, role=role, content=content)
+            for (message, role), content in zip(window, rendered, strict=True)
+        ]
+        return chat_history, has_more
 
 
-def main() -> None:
-    """Run the chatbot in interactive CLI mode."""
+@asynccontextmanager
+async def open_chatbot(memory_db_path: str = settings.memory_db_path) -> AsyncIterator[Chatbot]:
+    """Open the chatbot on the checkpoint store and render cache, warmed up to serve its first request."""
+    create_app_data_dir()
+    async with open_memory(memory_db_path) as memory, open_render_cache() as render_cache:
+        chatbot = Chatbot(memory, render_cache)
+        await chatbot.warm_up()
+        try:
+            yield chatbot
+        finally:
+            await chatbot.scheduler.aclose()
+
+
+async def run_cli() -> None:
+    """Run the interactive CLI conversation loop."""
     print("Welcome to the AI Chatbot! Type 'quit' or 'exit' to end the conversation.")
     print("You can ask questions or request information about properties and clients.")
-    chatbot = Chatbot()
-    thread_id = "3"
-    while True:
-        try:
-            user_input = input("User: ")
-            if user_input.lower() in {"quit", "exit", "q"}:
-                print("Goodbye!")
+    # The conversations of the CLI have no thread in the application database, they are kept in their own
+    # checkpoint store so the compaction of the API store does not delete them
+    async with open_chatbot(settings.cli_memory_db_path) as chatbot:
+        thread_id = "3"
+        while True:
+            try:
+                user_input = await asyncio.to_thread(input, "User: ")
+                if user_input.lower() in {"quit", "exit", "q"}:
+                    print("Goodbye!")
+                    break
+                await chatbot.stream_graph_updates(user_input, thread_id)
+            except Exception as error:
+                print(f"An error occurred: {error}")
                 break
-            chatbot.stream_graph_updates(user_input, thread_id)
-        except Exception as error:
-            print(f"An error occurred: {error}")
-            break
+
+
+def main() -> None:
+    """Run the chatbot in interactive CLI mode."""
+    asyncio.run(run_cli())
 
 
 if __name__ == "__main__":
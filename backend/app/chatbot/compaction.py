@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager, suppress
+
+from app.chatbot.memory import PooledSqliteSaver
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointCompactor:
+    """
+    Background compaction of the checkpoint store.
+
+    Every `interval` seconds, keeps only the `keep` latest checkpoints of the threads that got new checkpoints
+    since the previous pass (of every thread on the first pass), deletes the checkpoints of the threads that no
+    longer exist according to `live_thread_ids`, and returns up to `vacuum_pages` free pages to the file system.
+    """
+
+    def __init__(
+        self,
+        memory: PooledSqliteSaver,
+        live_thread_ids: Callable[[], Awaitable[set[str]]] | None = None,
+        keep: int = settings.checkpoint_keep_last,
+        interval: float = settings.checkpoint_compaction_interval,
+        vacuum_pages: int = settings.checkpoint_vacuum_pages,
+    ):
+        self.memory = memory
+        self.live_thread_ids = live_thread_ids
+        self.keep = keep
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+        self.task: asyncio.Task | None = None
+        self.compacted_once = False
+
+    async def compact(self) -> dict[str, int]:
+        """Run one compaction pass, returning the number of threads pruned and deleted and the pages left free."""
+        if self.compacted_once:
+            thread_ids = list(self.memory.touched_threads)
+        else:
+            thread_ids = await self.memory.athread_ids()
+            self.compacted_once = True
+        await self.memory.aprune(self.keep, thread_ids)
+
+        orphans = []
+        if self.live_thread_ids is not None:
+            # Threads are created before their first checkpoint, so listing the checkpointed threads first
+            # cannot mistake a thread created in between for a deleted one
+            checkpointed_thread_ids = await self.memory.athread_ids()
+            live_thread_ids = await self.live_thread_ids()
+            orphans = [thread_id for thread_id in checkpointed_thread_ids if thread_id not in live_thread_ids]
+            await self.memory.adelete_threads(orphans)
+
+        free_pages = await self.memory.aincremental_vacuum(self.vacuum_pages)
+        return {"pruned_threads": len(thread_ids), "deleted_threads": len(orphans), "free_pages": free_pages}
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.compact()
+            except Exception:
+                logger.warning("Checkpoint compaction failed", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def aclose(self) -> None:
+        if self.task is None:
+            return
+        self.task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self.task
+
+
+@asynccontextmanager
+async def run_checkpoint_compactor(
+    memory: PooledSqliteSaver, live_thread_ids: Callable[[], Awaitable[set[str]]] | None = None
+) -> AsyncIterator[CheckpointCompactor]:
+    """Compact the checkpoint store in the background for the duration of the context."""
+    compactor = CheckpointCompactor(memory, live_thread_ids)
+    compactor.start()
+    try:
+        yield compactor
+    finally:
+        await compactor.aclose()
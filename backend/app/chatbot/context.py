@@ -0,0 +1,151 @@
+import logging
+from collections.abc import Sequence
+from typing import Any
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import RunnableLambda
+from langgraph.prebuilt.chat_agent_executor import AgentState
+
+from app.chatbot.utils import message_text
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "You maintain the running summary of a conversation between a user and an assistant answering questions "
+    "about a real estate database. Update the summary with the new messages below. Keep the facts, figures, "
+    "names and filters the user may refer back to, drop the SQL details, and stay under 200 words.\n\n"
+    "Current summary:\n{summary}\n\nNew messages:\n{messages}\n\nUpdated summary:"
+)
+
+
+class ChatbotState(AgentState):
+    """Agent state extended with the rolling summary of the messages that left the context window."""
+
+    summary: str
+    # ID of the last message folded into the summary
+    summarized_until: str | None
+
+
+def compress_tool_output(message: BaseMessage, max_chars: int) -> BaseMessage:
+    """Truncate the content of a tool message to `max_chars` characters, leaving other messages untouched."""
+    content = message_text(message.content) if isinstance(message, ToolMessage) else ""
+    if not isinstance(message, ToolMessage) or len(content) <= max_chars:
+        return message
+    return message.model_copy(
+        update={"content": f"{content[:max_chars]}\n[{len(content) - max_chars} characters of old output omitted]"}
+    )
+
+
+def format_for_summary(messages: Sequence[BaseMessage], max_tool_chars: int) -> str:
+    lines = []
+    for message in messages:
+        text = message_text(compress_tool_output(message, max_tool_chars).content)
+        if text:
+            lines.append(f"{message.type}: {text}")
+    return "\n".join(lines)
+
+
+class ContextWindow:
+    """
+    Pre-model hook bounding the messages sent to the model on every agent step.
+
+    Keeps the last `max_turns` turns verbatim, or fewer when they exceed `max_tokens`, always including
+    the current turn. Tool outputs of the previous turns are truncated to `max_tool_chars` characters.
+    Messages leaving the window are folded into a rolling summary, kept in the checkpointed state
+    so each message is summarized only once, and sent to the model as a system message.
+    The full history stays in the state, only the model input is windowed.
+    """
+
+    def __init__(
+        self,
+        model: BaseChatModel,
+        max_turns: int = settings.context_max_turns,
+        max_tokens: int = settings.context_max_tokens,
+        max_tool_chars: int = settings.context_tool_output_chars,
+    ):
+        self.model = model
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.max_tool_chars = max_tool_chars
+
+    def as_runnable(self) -> RunnableLambda:
+        return RunnableLambda(self.invoke, afunc=self.ainvoke, name="context_window")
+
+    def window_start(self, messages: Sequence[BaseMessage]) -> int:
+        """Index of the first message of the oldest turn kept verbatim."""
+        turn_starts = [index for index, message in enumerate(messages) if isinstance(message, HumanMessage)]
+        if not turn_starts:
+            return 0
+        start = turn_starts[-1]
+        for candidate in reversed(turn_starts[-self.max_turns : -1]):
+            if count_tokens_approximately(self.window(messages, candidate)) > self.max_tokens:
+                break
+            start = candidate
+        return start
+
+    def window(self, messages: Sequence[BaseMessage], start: int) -> list[BaseMessage]:
+        """Messages from `start` on, with the tool outputs of the turns before the current one truncated."""
+        current_turn_start = max(
+            (index for index, message in enumerate(messages) if isinstance(message, HumanMessage)), default=0
+        )
+        return [
+            compress_tool_output(message, self.max_tool_chars) if index < current_turn_start else message
+            for index, message in enumerate(messages[start:], start)
+        ]
+
+    def summarized_index(self, state: dict[str, Any]) -> int:
+        """
+        Index of the last message folded into the summary, -1 if there is none. Looked up in the whole history:
+        the window can start before it, when the tool outputs that pushed it forward are truncated.
+        """
+        messages = state["messages"]
+        summarized_until = state.get("summarized_until")
+        for index in range(len(messages) - 1, -1, -1):
+            if messages[index].id == summarized_until:
+                return index
+        return -1
+
+    def to_summarize(self, state: dict[str, Any], start: int) -> list[BaseMessage]:
+        """Messages before the window that are not in the summary yet."""
+        return state["messages"][self.summarized_index(state) + 1 : start]
+
+    def update(self, state: dict[str, Any], start: int, summary: str) -> dict[str, Any]:
+        messages = state["messages"]
+        window = self.window(messages, start)
+        update: dict[str, Any] = {"llm_input_messages": window}
+        if summary:
+            update["llm_input_messages"] = [SystemMessage(f"Summary of the earlier conversation:\n{summary}"), *window]
+        # The summary only moves forward, the messages it already holds are not folded into it again
+        if summary != state.get("summary", "") and start - 1 > self.summarized_index(state):
+            update["summary"] = summary
+            update["summarized_until"] = messages[start - 1].id
+        return update
+
+    def summary_prompt(self, summary: str, new_messages: Sequence[BaseMessage]) -> str:
+        return SUMMARY_PROMPT.format(
+            summary=summary or "(empty)", messages=format_for_summary(new_messages, self.max_tool_chars)
+        )
+
+    def invoke(self, state: dict[str, Any]) -> dict[str, Any]:
+        start = self.window_start(state["messages"])
+        summary = state.get("summary", "")
+        if new_messages := self.to_summarize(state, start):
+            try:
+                summary = message_text(self.model.invoke(self.summary_prompt(summary, new_messages)).content)
+            except Exception:
+                logger.warning("Could not update the conversation summary", exc_info=True)
+        return self.update(state, start, summary)
+
+    async def ainvoke(self, state: dict[str, Any]) -> dict[str, Any]:
+        start = self.window_start(state["messages"])
+        summary = state.get("summary", "")
+        if new_messages := self.to_summarize(state, start):
+            try:
+                response = await self.model.ainvoke(self.summary_prompt(summary, new_messages))
+                summary = message_text(response.content)
+            except Exception:
+                logger.warning("Could not update the conversation summary", exc_info=True)
+        return self.update(state, start, summary)
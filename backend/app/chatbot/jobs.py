@@ -0,0 +1,156 @@
+import asyncio
+import logging
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass, field
+from typing import Literal
+from uuid import UUID, uuid4
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+JobStatus = Literal["queued", "running", "done", "failed"]
+FINISHED: frozenset[JobStatus] = frozenset({"done", "failed"})
+
+
+class JobQueueFullError(Exception):
+    """Raised when a user already has as many chat jobs queued or running as allowed."""
+
+
+@dataclass(eq=False)
+class Job:
+    """A chat turn run in the background, with its response or error once finished."""
+
+    user_id: UUID
+    thread_id: str
+    message: str
+    id: UUID = field(default_factory=uuid4)
+    status: JobStatus = "queued"
+    response: str | None = None
+    error: str | None = None
+    changed: asyncio.Condition = field(default_factory=asyncio.Condition, repr=False)
+
+    async def set_status(self, status: JobStatus, response: str | None = None, error: str | None = None) -> None:
+        async with self.changed:
+            self.status, self.response, self.error = status, response, error
+            self.changed.notify_all()
+
+    async def watch(self) -> AsyncIterator[JobStatus]:
+        """Yield the current status of the job, then every new status until the job finishes."""
+        status = None
+        while status not in FINISHED:
+            async with self.changed:
+                while self.status == status:
+                    await self.changed.wait()
+                status = self.status
+            yield status
+
+
+class JobQueue:
+    """
+    Runs chat turns on a fixed number of workers, so bursts of requests queue up instead of all
+    calling the model at once.
+
+    Jobs are queued per user and the workers take them round-robin across users: a user with many
+    jobs waits for their next turn behind every other user with queued jobs, and can have at most
+    `max_per_user` jobs queued or running. Finished jobs are kept for `result_ttl` seconds to be polled.
+    Jobs only live in memory, those still queued when the application stops are lost.
+    """
+
+    def __init__(
+        self,
+        run: Callable[[str, str], Awaitable[str]],
+        workers: int = settings.chat_job_workers,
+        max_per_user: int = settings.chat_job_max_per_user,
+        max_results: int = settings.chat_job_results_size,
+        result_ttl: float = settings.chat_job_result_ttl,
+    ):
+        self.run = run
+        self.workers = workers
+        self.max_per_user = max_per_user
+        self.jobs: dict[UUID, Job] = {}
+        self.results: TTLCache[UUID, Job] = TTLCache(max_results, result_ttl)
+        self.queues: dict[UUID, deque[Job]] = {}
+        self.pending: dict[UUID, int] = {}
+        self.ready: deque[UUID] = deque()
+        self.available = asyncio.Condition()
+        self.tasks: list[asyncio.Task] = []
+
+    async def submit(self, user_id: UUID, thread_id: str, message: str) -> Job:
+        """Queue a turn for the user, raising `JobQueueFullError` if they already reached their limit."""
+        if self.pending.get(user_id, 0) >= self.max_per_user:
+            raise JobQueueFullError(f"At most {self.max_per_user} chat jobs can be queued or running at once")
+        job = Job(user_id, thread_id, message)
+        self.jobs[job.id] = job
+        self.pending[user_id] = self.pending.get(user_id, 0) + 1
+        async with self.available:
+            if user_id not in self.queues:
+                self.queues[user_id] = deque()
+                self.ready.append(user_id)
+            self.queues[user_id].append(job)
+            self.available.notify()
+        return job
+
+    def get(self, job_id: UUID) -> Job | None:
+        return self.jobs.get(job_id) or self.results.get(job_id)
+
+    async def next_job(self) -> Job:
+        """Wait for a queued job and take it, from the user whose turn it is."""
+        async with self.available:
+            while not self.ready:
+                await self.available.wait()
+            user_id = self.ready.popleft()
+            queue = self.queues[user_id]
+            job = queue.popleft()
+            if queue:
+                self.ready.append(user_id)
+            else:
+                del self.queues[user_id]
+            return job
+
+    async def run_job(self, job: Job) -> None:
+        await job.set_status("running")
+        try:
+            response = await self.run(job.message, job.thread_id)
+        except Exception as error:
+            logger.warning("Chat job %s failed", job.id, exc_info=True)
+            await job.set_status("failed", error=str(error))
+        else:
+            await job.set_status("done", response=response)
+        finally:
+            self.results.set(job.id, job)
+            del self.jobs[job.id]
+            self.pending[job.user_id] -= 1
+            if not self.pending[job.user_id]:
+                del self.pending[job.user_id]
+
+    async def work(self) -> None:
+        while True:
+            await self.run_job(await self.next_job())
+
+    def start(self) -> None:
+        self.tasks = [asyncio.create_task(self.work()) for _ in range(self.workers)]
+
+    async def aclose(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        for task in self.tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+
+    def stats(self) -> dict[str, int]:
+        return {"queued": sum(map(len, self.queues.values())), "active": len(self.jobs), "users": len(self.pending)}
+
+
+@asynccontextmanager
+async def run_job_queue(run: Callable[[str, str], Awaitable[str]]) -> AsyncIterator[JobQueue]:
+    """Run the chat job workers for the duration of the context."""
+    queue = JobQueue(run)
+    queue.start()
+    try:
+        yield queue
+    finally:
+        await queue.aclose()
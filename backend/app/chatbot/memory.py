@@ -1,8 +1,341 @@
-import sqlite3
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Sequence
+from contextlib import AsyncExitStack, asynccontextmanager, suppress
+from typing import Any
 
-from langgraph.checkpoint.sqlite import SqliteSaver
+import aiosqlite
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.checkpoint.sqlite.utils import search_where
 
 from app.core.config import settings
 
-conn = sqlite3.connect(settings.memory_db_path, check_same_thread=False)
-memory = SqliteSaver(conn)
+logger = logging.getLogger(__name__)
+
+# Pragmas applied to every connection of the checkpoint store
+CONNECTION_PRAGMAS = (
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
+# Pragmas applied to the single writer connection only
+WRITER_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+)
+# Pragmas applied to the reader connections only
+READER_PRAGMAS = ("PRAGMA query_only = ON",)
+
+SELECT_CHECKPOINT = (
+    "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata FROM checkpoints"
+)
+SELECT_WRITES = (
+    "SELECT task_id, channel, type, value FROM writes "
+    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx"
+)
+INSERT_CHECKPOINT = (
+    "INSERT OR REPLACE INTO checkpoints "
+    "(thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+# Checkpoints of a thread beyond the `keep` latest ones of each namespace
+PRUNE_CHECKPOINTS = (
+    "DELETE FROM checkpoints WHERE rowid IN ("
+    "SELECT rowid FROM ("
+    "SELECT rowid, row_number() OVER (PARTITION BY checkpoint_ns ORDER BY checkpoint_id DESC) AS rank "
+    "FROM checkpoints WHERE thread_id = ?"
+    ") WHERE rank > ?)"
+)
+# Pending writes of a thread whose checkpoint was deleted
+DELETE_ORPHAN_WRITES = (
+    "DELETE FROM writes WHERE thread_id = ? AND NOT EXISTS (SELECT 1 FROM checkpoints WHERE "
+    "checkpoints.thread_id = writes.thread_id AND checkpoints.checkpoint_ns = writes.checkpoint_ns "
+    "AND checkpoints.checkpoint_id = writes.checkpoint_id)"
+)
+INSERT_WRITES = (
+    "INSERT OR {conflict} INTO writes "
+    "(thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+class PooledSqliteSaver(AsyncSqliteSaver):
+    """
+    Checkpoint saver on a WAL-mode SQLite store with a pool of reader connections and a single writer.
+
+    Reads borrow a connection from the reader pool, so concurrent conversations load their state in parallel.
+    Writes are queued to one writer task that commits everything queued at that moment in a single transaction,
+    which groups the `aput`/`aput_writes` calls issued by one agent step.
+    """
+
+    def __init__(
+        self,
+        writer: aiosqlite.Connection,
+        readers: Sequence[aiosqlite.Connection],
+        max_batch_size: int = 256,
+    ):
+        super().__init__(writer)
+        self.readers = list(readers)
+        self.reader_pool: asyncio.Queue[aiosqlite.Connection] = asyncio.Queue()
+        for reader in self.readers:
+            self.reader_pool.put_nowait(reader)
+        self.max_batch_size = max_batch_size
+        self.write_queue: asyncio.Queue[tuple[str, list[tuple], asyncio.Future]] = asyncio.Queue()
+        self.writer_task: asyncio.Task | None = None
+        self.setup_lock = asyncio.Lock()
+        # Held by the writer task while it commits a batch, so other uses of the writer connection do not interleave
+        self.write_lock = asyncio.Lock()
+        # Threads with new checkpoints since the last call to `aprune`
+        self.touched_threads: set[str] = set()
+
+    async def setup(self) -> None:
+        if self.is_setup:
+            return
+        async with self.setup_lock:
+            if self.is_setup:
+                return
+            for pragma in (*CONNECTION_PRAGMAS, *WRITER_PRAGMAS):
+                await self.conn.execute(pragma)
+            await self._enable_incremental_vacuum()
+            for reader in self.readers:
+                for pragma in (*CONNECTION_PRAGMAS, *READER_PRAGMAS):
+                    await reader.execute(pragma)
+            await super().setup()
+            self.writer_task = asyncio.create_task(self._write_batches())
+
+    async def _enable_incremental_vacuum(self) -> None:
+        async with self.conn.execute("PRAGMA auto_vacuum") as cur:
+            (auto_vacuum,) = await cur.fetchone()
+        if auto_vacuum != 2:
+            # Switching an existing database to incremental auto-vacuum takes a one-off full VACUUM
+            await self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await self.conn.execute("VACUUM")
+
+    async def aclose(self) -> None:
+        """Flush the queued writes and stop the writer task."""
+        if self.writer_task is None:
+            return
+        await self.write_queue.join()
+        self.writer_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self.writer_task
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a connection from the reader pool."""
+        await self.setup()
+        conn = await self.reader_pool.get()
+        try:
+            yield conn
+        finally:
+            self.reader_pool.put_nowait(conn)
+
+    async def write(self, query: str, rows: list[tuple]) -> None:
+        """Queue rows for the writer task and wait until the transaction holding them is committed."""
+        await self.setup()
+        future = asyncio.get_running_loop().create_future()
+        self.write_queue.put_nowait((query, rows, future))
+        await future
+
+    async def _write_batches(self) -> None:
+        while True:
+            batch = [await self.write_queue.get()]
+            # Let the other writes of the same agent step join this transaction
+            await asyncio.sleep(0)
+            while not self.write_queue.empty() and len(batch) < self.max_batch_size:
+                batch.append(self.write_queue.get_nowait())
+            try:
+                await self._commit_batch(batch)
+            except Exception as error:
+                # The writer task must outlive a failed batch, or every later write would wait forever
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+            finally:
+                for _ in batch:
+                    self.write_queue.task_done()
+
+    async def _commit_batch(self, batch: list[tuple[str, list[tuple], asyncio.Future]]) -> None:
+        async with self.write_lock:
+            try:
+                for query, rows, _ in batch:
+                    await self.conn.executemany(query, rows)
+                await self.conn.commit()
+            except Exception:
+                try:
+                    await self.conn.rollback()
+                except Exception:
+                    logger.warning("Could not roll back a failed checkpoint write", exc_info=True)
+                raise
+        for *_, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+    async def adelete_threads(self, thread_ids: Sequence[str]) -> None:
+        """Delete the checkpoints and pending writes of the given threads."""
+        rows = [(str(thread_id),) for thread_id in thread_ids]
+        if not rows:
+            return
+        await self.write("DELETE FROM checkpoints WHERE thread_id = ?", rows)
+        await self.write("DELETE FROM writes WHERE thread_id = ?", rows)
+
+    async def aprune(self, keep: int, thread_ids: Sequence[str]) -> None:
+        """Delete all but the `keep` latest checkpoints of the given threads, with their pending writes."""
+        self.touched_threads.difference_update(thread_ids)
+        if not thread_ids:
+            return
+        await self.write(PRUNE_CHECKPOINTS, [(str(thread_id), keep) for thread_id in thread_ids])
+        await self.write(DELETE_ORPHAN_WRITES, [(str(thread_id),) for thread_id in thread_ids])
+
+    async def athread_ids(self) -> list[str]:
+        """List the threads with checkpoints."""
+        async with self.reader() as conn, conn.execute("SELECT DISTINCT thread_id FROM checkpoints") as cur:
+            return [thread_id for (thread_id,) in await cur.fetchall()]
+
+    async def aincremental_vacuum(self, pages: int) -> int:
+        """Return up to `pages` free pages of the database file to the file system, returning the pages left free."""
+        await self.setup()
+        async with self.write_lock:
+            # `execute` steps the pragma once, freeing a single page, while a script runs it to completion
+            await self.conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            async with self.conn.execute("PRAGMA freelist_count") as cur:
+                (free_pages,) = await cur.fetchone()
+        return free_pages
+
+    async def _load_tuple(self, cur: aiosqlite.Cursor, row: tuple) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata = row
+        await cur.execute(SELECT_WRITES, (thread_id, checkpoint_ns, checkpoint_id))
+        return CheckpointTuple(
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            self.serde.loads_typed((type_, checkpoint)),
+            self.jsonplus_serde.loads(metadata) if metadata is not None else {},
+            (
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            [
+                (task_id, channel, self.serde.loads_typed((value_type, value)))
+                async for task_id, channel, value_type, value in cur
+            ],
+        )
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        async with self.reader() as conn, conn.cursor() as cur:
+            if checkpoint_id := get_checkpoint_id(config):
+                await cur.execute(
+                    f"{SELECT_CHECKPOINT} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                )
+            else:
+                await cur.execute(
+                    f"{SELECT_CHECKPOINT} WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                )
+            if row := await cur.fetchone():
+                return await self._load_tuple(cur, row)
+        return None
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        where, params = search_where(config, filter, before)
+        query = f"{SELECT_CHECKPOINT} {where} ORDER BY checkpoint_id DESC"
+        if limit:
+            query += f" LIMIT {limit}"
+        async with self.reader() as conn:
+            async with conn.execute(query, params) as cur:
+                rows = await cur.fetchall()
+            async with conn.cursor() as cur:
+                for row in rows:
+                    yield await self._load_tuple(cur, row)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+        serialized_metadata = self.jsonplus_serde.dumps(get_checkpoint_metadata(config, metadata))
+        row = (
+            str(thread_id),
+            checkpoint_ns,
+            checkpoint["id"],
+            config["configurable"].get("checkpoint_id"),
+            type_,
+            serialized_checkpoint,
+            serialized_metadata,
+        )
+        await self.write(INSERT_CHECKPOINT, [row])
+        self.touched_threads.add(str(thread_id))
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        conflict = "REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "IGNORE"
+        rows = [
+            (
+                str(config["configurable"]["thread_id"]),
+                str(config["configurable"]["checkpoint_ns"]),
+                str(config["configurable"]["checkpoint_id"]),
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                *self.serde.dumps_typed(value),
+            )
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        await self.write(INSERT_WRITES.format(conflict=conflict), rows)
+
+
+@asynccontextmanager
+async def open_memory(path: str = settings.memory_db_path) -> AsyncIterator[PooledSqliteSaver]:
+    """Open the checkpoint store that persists the chatbot conversations."""
+    async with AsyncExitStack() as stack:
+        writer = await stack.enter_async_context(aiosqlite.connect(path))
+        readers = [await stack.enter_async_context(aiosqlite.connect(path)) for _ in range(settings.memory_db_readers)]
+        memory = PooledSqliteSaver(writer, readers)
+        await memory.setup()
+        try:
+            yield memory
+        finally:
+            await memory.aclose()
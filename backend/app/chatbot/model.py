@@ -1,8 +1,275 @@
+import asyncio
+import re
+import time
+from collections.abc import AsyncIterator, Iterator, Sequence
+from itertools import count
+from typing import Any, cast
+
+from google.ai.generativelanguage_v1beta.types import GenerateContentResponse
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.messages.ai import UsageMetadata, add_usage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.runnables import Runnable
 from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_google_genai.chat_models import _response_to_result
 
+from app.chatbot.rate_limit import rate_limiter
+from app.chatbot.utils import message_text
 from app.core.config import settings
 
-model = ChatGoogleGenerativeAI(
+# Questions longer than this, or asking several things at once, are sent to the strong model
+COMPLEX_QUESTION_CHARS = 200
+# Wording of questions that need aggregates, grouping, comparisons or reasoning over the results
+COMPLEX_QUESTION_PATTERN = re.compile(
+    r"\b(compare[sd]?|comparison|versus|vs|trends?|over time|averages?|mean|median|ratios?|percent(age)?s?|"
+    r"growth|correlat\w*|rank\w*|top \d+|each|per|by (month|year|quarter|city|agent)|distribution|"
+    r"why|explain|analy[sz]\w*|forecast\w*|predict\w*)\b",
+    re.IGNORECASE,
+)
+
+# Arguments of the model calls that go into the request built by `ChatGoogleGenerativeAI._prepare_request`
+REQUEST_ARGUMENTS = ("tools", "functions", "safety_settings", "tool_config", "generation_config", "tool_choice")
+
+
+def input_tokens(message: BaseMessage) -> int | None:
+    usage = getattr(message, "usage_metadata", None)
+    return usage.get("input_tokens") if usage else None
+
+
+def stream_chunk(
+    response: GenerateContentResponse, usage: UsageMetadata | None
+) -> tuple[ChatGenerationChunk, UsageMetadata | None]:
+    """
+    Convert a streamed response to a chunk. Gemini reports the usage of the stream so far with every
+    response, the chunk only carries what was added since `usage`, the usage of the previous chunks.
+    """
+    chunk = cast(ChatGenerationChunk, _response_to_result(response, stream=True, prev_usage=usage).generations[0])
+    chunk_usage = chunk.message.usage_metadata
+    return chunk, add_usage(usage, chunk_usage) if usage and chunk_usage else usage or chunk_usage
+
+
+class RateLimitedChatGoogleGenerativeAI(ChatGoogleGenerativeAI):
+    """
+    Gemini chat model whose calls go through the process-wide `rate_limiter`.
+
+    Each attempt calls the client once, without the retries of `ChatGoogleGenerativeAI` and of the Google
+    API client, so the rate limiter is the only layer retrying and backing off. A call rejected as overloaded
+    is retried there, rather than failing the agent run and losing the work of the turn. A stream is only
+    retried if it failed before its first chunk.
+    """
+
+    def _call_arguments(self, messages: list[BaseMessage], stop: list[str] | None, **kwargs: Any) -> dict[str, Any]:
+        """Build the request of a call, returning the arguments of the client method."""
+        request_arguments = {name: kwargs.pop(name) for name in REQUEST_ARGUMENTS if name in kwargs}
+        cached_content = kwargs.pop("cached_content", None) or self.cached_content
+        request = self._prepare_request(messages, stop=stop, cached_content=cached_content, **request_arguments)
+        return {"request": request, **kwargs, "metadata": self.default_metadata, "retry": None}
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        arguments = self._call_arguments(messages, stop, **kwargs)
+        estimated_tokens = count_tokens_approximately(messages)
+        for attempt in count():
+            try:
+                with rate_limiter.sync_slot(estimated_tokens) as slot:
+                    result = _response_to_result(self.client.generate_content(**arguments))
+                    slot.responded()
+                    slot.used_tokens = input_tokens(result.generations[0].message) if result.generations else None
+                    return result
+            except Exception as error:
+                delay = rate_limiter.retry_delay(attempt, error)
+            time.sleep(delay)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        arguments = self._call_arguments(messages, stop, **kwargs)
+        estimated_tokens = count_tokens_approximately(messages)
+        for attempt in count():
+            try:
+                async with rate_limiter.slot(estimated_tokens) as slot:
+                    result = _response_to_result(await self.async_client.generate_content(**arguments))
+                    slot.responded()
+                    slot.used_tokens = input_tokens(result.generations[0].message) if result.generations else None
+                    return result
+            except Exception as error:
+                delay = rate_limiter.retry_delay(attempt, error)
+            await asyncio.sleep(delay)
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        arguments = self._call_arguments(messages, stop, **kwargs)
+        estimated_tokens = count_tokens_approximately(messages)
+        for attempt in count():
+            started = False
+            try:
+                with rate_limiter.sync_slot(estimated_tokens) as slot:
+                    usage = None
+                    for response in self.client.stream_generate_content(**arguments):
+                        started = True
+                        slot.responded()
+                        chunk, usage = stream_chunk(response, usage)
+                        slot.used_tokens = usage["input_tokens"] if usage else None
+                        if run_manager:
+                            run_manager.on_llm_new_token(chunk.text)
+                        yield chunk
+                    return
+            except Exception as error:
+                if started:
+                    raise
+                delay = rate_limiter.retry_delay(attempt, error)
+            time.sleep(delay)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        arguments = self._call_arguments(messages, stop, **kwargs)
+        estimated_tokens = count_tokens_approximately(messages)
+        for attempt in count():
+            started = False
+            try:
+                async with rate_limiter.slot(estimated_tokens) as slot:
+                    usage = None
+                    async for response in await self.async_client.stream_generate_content(**arguments):
+                        started = True
+                        slot.responded()
+                        chunk, usage = stream_chunk(response, usage)
+                        slot.used_tokens = usage["input_tokens"] if usage else None
+                        if run_manager:
+                            await run_manager.on_llm_new_token(chunk.text)
+                        yield chunk
+                    return
+            except Exception as error:
+                if started:
+                    raise
+                delay = rate_limiter.retry_delay(attempt, error)
+            await asyncio.sleep(delay)
+
+
+def is_complex_question(question: str) -> bool:
+    return (
+        len(question) > COMPLEX_QUESTION_CHARS
+        or question.count("?") > 1
+        or COMPLEX_QUESTION_PATTERN.search(question) is not None
+    )
+
+
+def is_failed_step(message: BaseMessage) -> bool:
+    return isinstance(message, ToolMessage) and (
+        message.status == "error" or message_text(message.content).startswith("Error")
+    )
+
+
+def needs_strong_model(
+    messages: Sequence[BaseMessage], escalation_steps: int = settings.model_escalation_steps
+) -> bool:
+    """
+    Whether the next step of the turn ending `messages` goes to the strong model: the question of the turn
+    is complex, a tool call of the turn failed (typically a SQL query), or the turn already took
+    `escalation_steps` steps without reaching an answer.
+    """
+    start = next((index for index in range(len(messages) - 1, -1, -1) if isinstance(messages[index], HumanMessage)), -1)
+    steps = messages[start + 1 :]
+    if any(is_failed_step(message) for message in steps):
+        return True
+    if sum(isinstance(message, AIMessage) for message in steps) >= escalation_steps:
+        return True
+    return start >= 0 and is_complex_question(message_text(messages[start].content))
+
+
+class RoutedChatModel(BaseChatModel):
+    """
+    Chat model sending every call to one of two models: simple steps (listing tables, looking up a schema,
+    picking a tool, answering a short factual question) to the `fast` one, complex questions and the steps
+    after a failed attempt to the `strong` one, see `needs_strong_model`.
+
+    Tools are bound to the router, whose calls are made with the bound tools on the chosen model.
+    Both models must therefore accept the same tool format.
+    """
+
+    fast: BaseChatModel
+    strong: BaseChatModel
+
+    @property
+    def _llm_type(self) -> str:
+        return "routed-chat-model"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"fast": self.fast._identifying_params, "strong": self.strong._identifying_params}
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any) -> Runnable:
+        return self.bind(**self.strong.bind_tools(tools, **kwargs).kwargs)
+
+    def route(self, messages: list[BaseMessage]) -> BaseChatModel:
+        return self.strong if needs_strong_model(messages) else self.fast
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return self.route(messages)._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        return await self.route(messages)._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        yield from self.route(messages)._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in self.route(messages)._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            yield chunk
+
+
+strong_model = RateLimitedChatGoogleGenerativeAI(
     model=settings.model_name,
     google_api_key=settings.GOOGLE_API_KEY,
 )
+fast_model = (
+    strong_model
+    if settings.fast_model_name == settings.model_name
+    else RateLimitedChatGoogleGenerativeAI(model=settings.fast_model_name, google_api_key=settings.GOOGLE_API_KEY)
+)
+model = RoutedChatModel(fast=fast_model, strong=strong_model)
@@ -1,11 +1,66 @@
+import json
+import logging
+import threading
 import warnings
+from pathlib import Path
 
-from langchain import hub
+from langchain_core.prompts import ChatPromptTemplate
 
-warnings.filterwarnings("ignore", module="langsmith.*")
+from app.core.config import create_app_data_dir, settings
 
+logger = logging.getLogger(__name__)
 
-prompt_template = hub.pull("langchain-ai/sql-agent-system-prompt")
+PROMPT_NAME = "langchain-ai/sql-agent-system-prompt"
+# Bump, with a new vendored file, whenever the template changes, so cached hub copies of an older version are ignored
+PROMPT_VERSION = 1
+VENDORED_PROMPT_PATH = Path(__file__).parent / "prompts" / f"sql_agent_system_prompt.v{PROMPT_VERSION}.txt"
+PROMPT_VARIABLES = {"dialect", "top_k"}
 
-assert len(prompt_template.messages) == 1
+
+def load_prompt_template() -> str:
+    """Return the template refreshed from the hub and cached on disk, or the vendored template."""
+    try:
+        cached = json.loads(Path(settings.prompt_cache_path).read_text(encoding="utf-8"))
+        if cached["version"] == PROMPT_VERSION:
+            return cached["template"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return VENDORED_PROMPT_PATH.read_text(encoding="utf-8")
+
+
+def refresh_prompt_cache() -> None:
+    """Pull the prompt from the LangChain hub and cache its template on disk, for the next start."""
+    # The hub client is only needed here, so it is not imported on startup
+    from langchain import hub
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", module="langsmith.*")
+        prompt = hub.pull(PROMPT_NAME)
+    if len(prompt.messages) != 1 or set(prompt.input_variables) != PROMPT_VARIABLES:
+        raise ValueError(f"Unexpected prompt {PROMPT_NAME} from the hub: {prompt.input_variables}")
+
+    create_app_data_dir()
+    cache_path = Path(settings.prompt_cache_path)
+    temp_path = cache_path.with_suffix(".tmp")
+    temp_path.write_text(
+        json.dumps({"version": PROMPT_VERSION, "template": prompt.messages[0].prompt.template}), encoding="utf-8"
+    )
+    temp_path.replace(cache_path)
+
+
+def refresh_prompt_in_background() -> threading.Thread:
+    """Refresh the cached prompt from the hub on a daemon thread, logging failures instead of raising them."""
+
+    def refresh() -> None:
+        try:
+            refresh_prompt_cache()
+        except Exception:
+            logger.warning("Could not refresh the system prompt from the hub", exc_info=True)
+
+    thread = threading.Thread(target=refresh, name="prompt-refresh", daemon=True)
+    thread.start()
+    return thread
+
+
+prompt_template = ChatPromptTemplate.from_messages([("system", load_prompt_template())])
 system_message = prompt_template.format(dialect="SQLite", top_k=5)
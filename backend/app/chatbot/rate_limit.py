@@ -0,0 +1,203 @@
+import asyncio
+import random
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+
+from google.api_core import exceptions
+
+from app.core.config import settings
+
+# Errors telling the client to slow down, worth retrying after a backoff
+OVERLOAD_ERRORS = (exceptions.ResourceExhausted, exceptions.TooManyRequests, exceptions.ServiceUnavailable)
+
+
+class TokenBucket:
+    """
+    Allows `per_minute` units per minute, in bursts of up to `capacity` units (a tenth of a minute's worth
+    by default, so a full burst followed by a minute of refill stays close to a per-minute quota).
+
+    A reservation is always granted and may overdraw the bucket, the caller is told how long to wait
+    before going ahead. Callers are therefore served in order and a reservation larger than the
+    capacity is still served eventually. A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else max(1.0, per_minute / 10)
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` units from the bucket, returning the delay (in seconds) before using them."""
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            self.refill()
+            self.available -= amount
+            return max(0.0, -self.available / self.rate)
+
+    def refund(self, amount: float) -> None:
+        """Give back units reserved but not used, or take more (a negative amount) if they were underestimated."""
+        if not self.rate:
+            return
+        with self.lock:
+            self.refill()
+            self.available = min(self.capacity, self.available + amount)
+
+
+class AdaptiveConcurrency:
+    """
+    Limits the calls in flight with additive increase, multiplicative decrease (AIMD).
+
+    Every call that completes under `latency_target` raises the limit by `1 / limit`, about one more call
+    per round of calls. An overloaded upstream, or a slow call, divides the limit by two, at most once per
+    `latency_target` seconds so a burst of errors from the same round only counts once.
+    """
+
+    def __init__(self, initial: float, minimum: float, maximum: float, latency_target: float):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.decreased_at = float("-inf")
+        self.changed = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self.changed:
+            while self.in_flight >= int(self.limit):
+                await self.changed.wait()
+            self.in_flight += 1
+
+    async def release(self, latency: float, overloaded: bool) -> None:
+        async with self.changed:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded or latency > self.latency_target:
+                if now - self.decreased_at > self.latency_target:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.decreased_at = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.changed.notify_all()
+
+
+class Slot:
+    """A call admitted by the rate limiter, reporting how it went once it is done."""
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.used_tokens: int | None = None
+        self.overloaded = False
+        self.first_response_at: float | None = None
+
+    def responded(self) -> None:
+        """Record the first response of the upstream, which ends the latency measured for the call."""
+        if self.first_response_at is None:
+            self.first_response_at = time.monotonic()
+
+
+class RateLimiter:
+    """
+    Client-side limits shared by every model call of the process: requests and tokens per minute,
+    and the adaptive number of calls in flight. Calls rejected as overloaded are retried after an
+    exponential backoff with full jitter, so concurrent callers do not retry in lockstep.
+
+    `request_burst` caps the requests sent at once after an idle period, a tenth of a minute's worth by
+    default. It should not exceed the burst the upstream allows.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = settings.model_requests_per_minute,
+        tokens_per_minute: float = settings.model_tokens_per_minute,
+        max_concurrency: int = settings.model_max_concurrency,
+        latency_target: float = settings.model_latency_target,
+        max_retries: int = settings.model_max_retries,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        request_burst: float | None = None,
+    ):
+        self.requests = TokenBucket(requests_per_minute, request_burst)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(max(1, max_concurrency // 2), 1, max_concurrency, latency_target)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+        self.overloads = 0
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def reserve(self, estimated_tokens: int) -> float:
+        """Take a request and the estimated tokens from the quotas, returning the delay before the call."""
+        return max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+
+    def settle(self, slot: Slot) -> None:
+        """Correct the token quota with the tokens the call reported using."""
+        if slot.used_tokens is not None:
+            self.tokens.refund(slot.estimated_tokens - slot.used_tokens)
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int) -> AsyncIterator[Slot]:
+        """Wait for the quotas and a free slot, then hold the slot for the duration of the call."""
+        if delay := self.reserve(estimated_tokens):
+            await asyncio.sleep(delay)
+        await self.concurrency.acquire()
+        slot = Slot(estimated_tokens)
+        started_at = time.monotonic()
+        try:
+            yield slot
+        except OVERLOAD_ERRORS:
+            slot.overloaded = True
+            self.overloads += 1
+            raise
+        finally:
+            latency = (slot.first_response_at or time.monotonic()) - started_at
+            await self.concurrency.release(latency, slot.overloaded)
+            self.settle(slot)
+
+    @contextmanager
+    def sync_slot(self, estimated_tokens: int) -> Iterator[Slot]:
+        """
+        `slot` for the synchronous calls, blocking their thread until the quotas allow the call.
+        They do not take a slot of the adaptive concurrency limit, which only the event loop can wait for.
+        """
+        if delay := self.reserve(estimated_tokens):
+            time.sleep(delay)
+        slot = Slot(estimated_tokens)
+        try:
+            yield slot
+        except OVERLOAD_ERRORS:
+            slot.overloaded = True
+            self.overloads += 1
+            raise
+        finally:
+            self.settle(slot)
+
+    def retry_delay(self, attempt: int, error: Exception) -> float:
+        """Return the delay before retrying a call that failed with `error`, or raise it if it cannot be retried."""
+        if not isinstance(error, OVERLOAD_ERRORS) or attempt >= self.max_retries:
+            raise error
+        self.retries += 1
+        return self.backoff(attempt)
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "concurrency_limit": self.concurrency.limit,
+            "in_flight": self.concurrency.in_flight,
+            "retries": self.retries,
+            "overloads": self.overloads,
+        }
+
+
+rate_limiter = RateLimiter()
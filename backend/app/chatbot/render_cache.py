@@ -0,0 +1,107 @@
+import hashlib
+from collections.abc import AsyncIterator, Sequence
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+from app.chatbot.utils import render_markdown_to_html
+from app.core.cache import LRUCache
+from app.core.config import settings
+
+# Bump whenever `render_markdown_to_html` changes its output, so previously rendered HTML is re-rendered
+RENDERER_VERSION = 1
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class RenderCache:
+    """
+    Rendered HTML of chat messages, keyed on message ID and checked against the content hash and renderer version.
+
+    Lookups go through an in-process LRU first and then, when a connection is given,
+    through a persistent table so re-opened threads need no Markdown parsing at all.
+    """
+
+    def __init__(self, conn: aiosqlite.Connection | None = None, max_size: int = settings.render_cache_size):
+        self.conn = conn
+        self.memory: LRUCache[str, tuple[str, str]] = LRUCache(max_size)
+
+    async def setup(self) -> None:
+        if self.conn is None:
+            return
+        await self.conn.execute("PRAGMA journal_mode = WAL")
+        await self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rendered_messages (
+                message_id TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                renderer_version INTEGER NOT NULL,
+                html TEXT NOT NULL
+            )
+            """
+        )
+        await self.conn.commit()
+
+    async def render(self, message_id: str | None, content: str) -> str:
+        """Render a single message to HTML, using the cached HTML if it is still valid."""
+        return (await self.render_many([(message_id, content)]))[0]
+
+    async def render_many(self, messages: Sequence[tuple[str | None, str]]) -> list[str]:
+        """Render `(message_id, content)` pairs to HTML, only parsing the messages missing from the cache."""
+        hashes = [content_hash(content) for _, content in messages]
+        rendered: list[str | None] = [None] * len(messages)
+        missing: dict[str, int] = {}
+        for index, (message_id, _) in enumerate(messages):
+            cached = self.memory.get(message_id) if message_id is not None else None
+            if cached is not None and cached[0] == hashes[index]:
+                rendered[index] = cached[1]
+            elif message_id is not None:
+                missing[message_id] = index
+
+        if missing and self.conn is not None:
+            for message_id, html in await self._load(missing, hashes):
+                index = missing.pop(message_id)
+                rendered[index] = html
+                self.memory.set(message_id, (hashes[index], html))
+
+        new_rows = []
+        for index, (message_id, content) in enumerate(messages):
+            if rendered[index] is not None:
+                continue
+            rendered[index] = render_markdown_to_html(content)
+            if message_id is not None:
+                self.memory.set(message_id, (hashes[index], rendered[index]))
+                new_rows.append((message_id, hashes[index], RENDERER_VERSION, rendered[index]))
+        if new_rows and self.conn is not None:
+            await self.conn.executemany(
+                "INSERT OR REPLACE INTO rendered_messages (message_id, content_hash, renderer_version, html) "
+                "VALUES (?, ?, ?, ?)",
+                new_rows,
+            )
+            await self.conn.commit()
+        return rendered
+
+    async def _load(self, missing: dict[str, int], hashes: list[str]) -> list[tuple[str, str]]:
+        message_ids = list(missing)
+        rows = []
+        # Stay below SQLite's limit on the number of bound parameters
+        for start in range(0, len(message_ids), 500):
+            chunk = message_ids[start : start + 500]
+            async with self.conn.execute(
+                "SELECT message_id, content_hash, html FROM rendered_messages "
+                f"WHERE renderer_version = ? AND message_id IN ({', '.join('?' * len(chunk))})",
+                (RENDERER_VERSION, *chunk),
+            ) as cursor:
+                rows.extend(await cursor.fetchall())
+        return [(message_id, html) for message_id, hash_, html in rows if hashes[missing[message_id]] == hash_]
+
+
+@asynccontextmanager
+async def open_render_cache() -> AsyncIterator[RenderCache]:
+    """Open the render cache persisted next to the checkpoint DB."""
+    async with aiosqlite.connect(settings.render_cache_db_path) as conn:
+        render_cache = RenderCache(conn)
+        await render_cache.setup()
+        yield render_cache
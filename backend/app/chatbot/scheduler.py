@@ -0,0 +1,112 @@
+import asyncio
+from collections.abc import AsyncIterator, Callable
+from contextlib import suppress
+from typing import Any
+
+
+class Turn:
+    """
+    A chat turn in flight. Its events are recorded as the agent produces them and replayed
+    to every request waiting on the turn, so a request joining late still receives all of them.
+    """
+
+    def __init__(self):
+        self.events: list[dict[str, Any]] = []
+        self.error: BaseException | None = None
+        self.finished = False
+        self.changed = asyncio.Condition()
+
+    async def publish(self, event: dict[str, Any]) -> None:
+        async with self.changed:
+            self.events.append(event)
+            self.changed.notify_all()
+
+    async def finish(self, error: BaseException | None = None) -> None:
+        async with self.changed:
+            self.error = error
+            self.finished = True
+            self.changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[dict[str, Any]]:
+        """Yield the events of the turn from the first one, raising the error of the turn if it failed."""
+        index = 0
+        while True:
+            async with self.changed:
+                while index == len(self.events) and not self.finished:
+                    await self.changed.wait()
+                events = self.events[index:]
+                finished, error = self.finished, self.error
+            for event in events:
+                yield event
+            index += len(events)
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+
+class TurnScheduler:
+    """
+    Runs the chat turns of a thread one at a time, in the order they were submitted, while turns
+    of different threads run concurrently.
+
+    A message submitted to a thread that already has the same message queued or running joins
+    that turn instead of running the agent again, which covers double submits and several tabs
+    on one thread. Turns run in their own task, so a client disconnecting does not abort a turn
+    other requests are waiting on, nor leave the thread with half of a turn.
+    """
+
+    def __init__(self):
+        self.turns: dict[tuple[str, str], Turn] = {}
+        self.locks: dict[str, asyncio.Lock] = {}
+        self.queued: dict[str, int] = {}
+        self.tasks: set[asyncio.Task] = set()
+        self.coalesced = 0
+
+    def submit(self, thread_id: str, message: str, run: Callable[[], AsyncIterator[dict[str, Any]]]) -> Turn:
+        """Queue `run` as the turn of the message on the thread, or return the identical turn already in flight."""
+        key = (thread_id, message.strip())
+        if (turn := self.turns.get(key)) is not None:
+            self.coalesced += 1
+            return turn
+        turn = self.turns[key] = Turn()
+        # Locks are taken in submission order, as the tasks start in creation order and `asyncio.Lock` is fair
+        lock = self.locks.setdefault(thread_id, asyncio.Lock())
+        self.queued[thread_id] = self.queued.get(thread_id, 0) + 1
+        task = asyncio.create_task(self.run_turn(key, turn, lock, run))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return turn
+
+    async def run_turn(
+        self, key: tuple[str, str], turn: Turn, lock: asyncio.Lock, run: Callable[[], AsyncIterator[dict[str, Any]]]
+    ) -> None:
+        thread_id = key[0]
+        error = None
+        try:
+            async with lock:
+                async for event in run():
+                    await turn.publish(event)
+        except Exception as run_error:
+            error = run_error
+        except asyncio.CancelledError:
+            error = RuntimeError("The chat turn was cancelled")
+            raise
+        finally:
+            del self.turns[key]
+            self.queued[thread_id] -= 1
+            if not self.queued[thread_id]:
+                del self.queued[thread_id]
+                del self.locks[thread_id]
+            await turn.finish(error)
+
+    def stats(self) -> dict[str, int]:
+        return {"turns": len(self.turns), "threads": len(self.locks), "coalesced": self.coalesced}
+
+    async def aclose(self) -> None:
+        """Cancel the turns still queued or running."""
+        for task in list(self.tasks):
+            task.cancel()
+        for task in list(self.tasks):
+            with suppress(asyncio.CancelledError):
+                await task
@@ -0,0 +1,140 @@
+import threading
+from dataclasses import dataclass, field
+
+from sqlalchemy import Engine
+
+from app.chatbot.sql_cache import DataVersionMonitor
+
+
+def quote_identifier(name: str) -> str:
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+@dataclass
+class ColumnStats:
+    name: str
+    type: str
+    distinct_count: int
+    null_count: int
+    min_value: object
+    max_value: object
+
+
+@dataclass
+class TableInfo:
+    name: str
+    ddl: str
+    columns: list[str]
+    sample_rows: list[tuple]
+    row_count: int
+    column_stats: list[ColumnStats] = field(default_factory=list)
+
+    def describe(self) -> str:
+        """Describe the table in the format of `SQLDatabase.get_table_info`, followed by its statistics."""
+        sample_rows = "\n".join("\t".join(str(value)[:100] for value in row) for row in self.sample_rows)
+        stats = "\n".join(
+            f"{stats.name} ({stats.type}): {stats.distinct_count} distinct, {stats.null_count} null, "
+            f"min {str(stats.min_value)[:100]!r}, max {str(stats.max_value)[:100]!r}"
+            for stats in self.column_stats
+        )
+        columns = "\t".join(self.columns)
+        return (
+            f"\n{self.ddl}\n\n"
+            f"/*\n{len(self.sample_rows)} rows from {self.name} table:\n{columns}\n{sample_rows}\n*/\n\n"
+            f"/*\n{self.row_count} rows in {self.name} table, column statistics:\n{stats}\n*/"
+        )
+
+
+class SchemaCatalog:
+    """
+    Schema, sample rows, row counts and column statistics of the chatbot database, built once and kept in memory.
+
+    Serves the `sql_db_list_tables` and `sql_db_schema` tools without reflecting the database on every call.
+    The schema is rebuilt only when `PRAGMA schema_version` reports a schema change, and the sample rows, row
+    counts and statistics are recomputed when the data version changes, like the query and answer caches.
+    """
+
+    def __init__(self, engine: Engine, monitor: DataVersionMonitor, sample_rows: int = 3):
+        self.engine = engine
+        self.monitor = monitor
+        self.sample_rows = sample_rows
+        self.tables: dict[str, TableInfo] = {}
+        self.column_types: dict[str, list[tuple[str, str]]] = {}
+        self.schema_version: int | None = None
+        self.data_version: tuple[int, int] | None = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """Rebuild the catalog if the schema changed, or its data if the content changed, since the last refresh."""
+        schema_version = self.monitor.schema_version()
+        data_version = self.monitor.data_version()
+        if (schema_version, data_version) == (self.schema_version, self.data_version):
+            return
+        with self._lock:
+            if schema_version != self.schema_version:
+                self.tables = self._build()
+            elif data_version != self.data_version:
+                self.tables = self._build(self.tables)
+            self.schema_version, self.data_version = schema_version, data_version
+
+    def _build(self, tables: dict[str, TableInfo] | None = None) -> dict[str, TableInfo]:
+        """Read the tables of the database, or only the data of the given tables if their schema is known."""
+        with self.engine.connect() as conn:
+            if tables is None:
+                rows = conn.exec_driver_sql(
+                    "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+                    "ORDER BY name"
+                ).all()
+                self.column_types = {
+                    name: [
+                        (row[1], row[2]) for row in conn.exec_driver_sql(f"PRAGMA table_info({quote_identifier(name)})")
+                    ]
+                    for name, _ in rows
+                }
+            else:
+                rows = [(name, table.ddl) for name, table in tables.items()]
+            return {name: self._table_info(conn, name, ddl) for name, ddl in rows}
+
+    def _table_info(self, conn, name: str, ddl: str) -> TableInfo:
+        quoted = quote_identifier(name)
+        sample = conn.exec_driver_sql(f"SELECT * FROM {quoted} LIMIT {self.sample_rows}")
+        return TableInfo(
+            name=name,
+            ddl=ddl,
+            columns=list(sample.keys()),
+            sample_rows=[tuple(row) for row in sample],
+            row_count=conn.exec_driver_sql(f"SELECT count(*) FROM {quoted}").scalar_one(),
+            column_stats=self._column_stats(conn, quoted, self.column_types[name]),
+        )
+
+    @staticmethod
+    def _column_stats(conn, quoted_table: str, column_types: list[tuple[str, str]]) -> list[ColumnStats]:
+        if not column_types:
+            return []
+        # One scan of the table computes the distinct count, null count, min and max of every column
+        aggregates = ", ".join(
+            f"count(DISTINCT {quoted}), sum({quoted} IS NULL), min({quoted}), max({quoted})"
+            for quoted in (quote_identifier(column) for column, _ in column_types)
+        )
+        row = conn.exec_driver_sql(f"SELECT {aggregates} FROM {quoted_table}").one()
+        column_stats = []
+        for index, (column, column_type) in enumerate(column_types):
+            distinct_count, null_count, min_value, max_value = row[4 * index : 4 * index + 4]
+            column_stats.append(ColumnStats(column, column_type, distinct_count, null_count or 0, min_value, max_value))
+        return column_stats
+
+    def table_names(self) -> list[str]:
+        self.refresh()
+        return list(self.tables)
+
+    def table_columns(self) -> dict[str, list[str]]:
+        self.refresh()
+        return {name: table.columns for name, table in self.tables.items()}
+
+    def table_info(self, table_names: list[str]) -> str:
+        """Describe the given tables, or return an error message naming the unknown ones."""
+        self.refresh()
+        tables = self.tables
+        if missing := {name for name in table_names if name not in tables}:
+            return f"Error: table_names {missing} not found in database"
+        return "\n\n".join(tables[name].describe() for name in table_names)
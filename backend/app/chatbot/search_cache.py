@@ -0,0 +1,218 @@
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Protocol
+
+from langchain_community.tools.tavily_search import TavilySearchResults
+from langchain_community.utilities.tavily_search import TavilySearchAPIWrapper
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
+from pydantic import Field
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+SearchKey = tuple[str, int]
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a search query so trivially different spellings share a cache key:
+    lowercase it, collapse whitespace and drop the trailing punctuation.
+    """
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!.").strip().lower()
+
+
+class SearchBackend(Protocol):
+    async def search(self, query: str, max_results: int) -> dict[str, Any]:
+        """Search the web, returning the raw response of the Tavily search API."""
+        ...
+
+    def search_sync(self, query: str, max_results: int) -> dict[str, Any]:
+        """`search`, blocking the calling thread."""
+        ...
+
+
+class TavilySearchBackend:
+    """Searches with the Tavily API."""
+
+    def __init__(self, api_wrapper: TavilySearchAPIWrapper):
+        self.api_wrapper = api_wrapper
+
+    async def search(self, query: str, max_results: int) -> dict[str, Any]:
+        return await self.api_wrapper.raw_results_async(query, max_results)
+
+    def search_sync(self, query: str, max_results: int) -> dict[str, Any]:
+        return self.api_wrapper.raw_results(query, max_results)
+
+
+class StubSearchBackend:
+    """
+    Local search backend answering every query with made-up results after `delay` seconds, without a network call.
+    For tests and development without a Tavily API key. Counts its calls.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+
+    async def search(self, query: str, max_results: int) -> dict[str, Any]:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.response(query, max_results)
+
+    def search_sync(self, query: str, max_results: int) -> dict[str, Any]:
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.response(query, max_results)
+
+    def response(self, query: str, max_results: int) -> dict[str, Any]:
+        results = [
+            {
+                "title": f"Result {index + 1} for {query}",
+                "url": f"https://example.com/search/{index + 1}",
+                "content": f"Stub content {index + 1} about {query}.",
+                "score": 1.0 - index / max(1, max_results),
+            }
+            for index in range(max_results)
+        ]
+        return {"query": query, "results": results}
+
+
+class SearchCache:
+    """
+    Web search results keyed on the normalized query and the number of results, kept for `ttl` seconds.
+
+    Lookups go through an in-process TTL cache first and then, when a path is given, through a SQLite table,
+    so results survive restarts. Concurrent lookups of the same key missing from both share a single backend
+    call, which runs in its own task: a caller being cancelled does not cancel the search of the others.
+    Synchronous lookups, through `search_sync`, share both caches but not the backend calls in flight.
+    Failed searches are not cached.
+    """
+
+    def __init__(
+        self,
+        backend: SearchBackend,
+        path: str | None = settings.search_cache_db_path,
+        max_size: int = settings.search_cache_size,
+        ttl: float = settings.search_cache_ttl,
+    ):
+        self.backend = backend
+        self.path = path
+        self.ttl = ttl
+        self.memory: TTLCache[SearchKey, dict[str, Any]] = TTLCache(max_size, ttl)
+        self.in_flight: dict[SearchKey, asyncio.Task] = {}
+        self.searches = 0
+        self.coalesced = 0
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS search_results (
+                    query TEXT NOT NULL,
+                    max_results INTEGER NOT NULL,
+                    response TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (query, max_results)
+                )
+                """
+            )
+        return self._conn
+
+    def load(self, key: SearchKey) -> tuple[float, dict[str, Any]] | None:
+        """Read a search response from the persistent table, with its remaining time to live."""
+        with self._lock:
+            row = (
+                self._connection()
+                .execute("SELECT response, expires_at FROM search_results WHERE query = ? AND max_results = ?", key)
+                .fetchone()
+            )
+        if row is None or row[1] <= time.time():
+            return None
+        return row[1] - time.time(), json.loads(row[0])
+
+    def store(self, key: SearchKey, response: dict[str, Any]) -> None:
+        """Persist a search response, dropping the expired ones."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM search_results WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "INSERT OR REPLACE INTO search_results (query, max_results, response, expires_at) VALUES (?, ?, ?, ?)",
+                (*key, json.dumps(response), now + self.ttl),
+            )
+            conn.commit()
+
+    async def search(self, query: str, max_results: int) -> dict[str, Any]:
+        """Return the cached response to the query, searching the backend if it is missing or expired."""
+        key = (normalize_query(query), max_results)
+        if (response := self.memory.get(key)) is not None:
+            return response
+        if (task := self.in_flight.get(key)) is not None:
+            self.coalesced += 1
+        else:
+            task = self.in_flight[key] = asyncio.create_task(self.fetch(key, query))
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def fetch(self, key: SearchKey, query: str) -> dict[str, Any]:
+        if self.path is not None and (entry := await asyncio.to_thread(self.load, key)) is not None:
+            ttl, response = entry
+            self.memory.set(key, response, ttl)
+            return response
+        self.searches += 1
+        response = await self.backend.search(query, key[1])
+        self.memory.set(key, response)
+        if self.path is not None:
+            await asyncio.to_thread(self.store, key, response)
+        return response
+
+    def search_sync(self, query: str, max_results: int) -> dict[str, Any]:
+        """`search`, blocking the calling thread."""
+        key = (normalize_query(query), max_results)
+        if (response := self.memory.get(key)) is not None:
+            return response
+        if self.path is not None and (entry := self.load(key)) is not None:
+            ttl, response = entry
+            self.memory.set(key, response, ttl)
+            return response
+        self.searches += 1
+        response = self.backend.search_sync(query, max_results)
+        self.memory.set(key, response)
+        if self.path is not None:
+            self.store(key, response)
+        return response
+
+    def stats(self) -> dict[str, int]:
+        return {**self.memory.stats(), "searches": self.searches, "coalesced": self.coalesced}
+
+
+class CachedTavilySearchResults(TavilySearchResults):
+    """Tavily search tool served from a `SearchCache`."""
+
+    cache: SearchCache = Field(exclude=True)
+
+    def _run(
+        self, query: str, run_manager: CallbackManagerForToolRun | None = None
+    ) -> tuple[list[dict[str, str]] | str, dict]:
+        try:
+            response = self.cache.search_sync(query, self.max_results)
+        except Exception as error:
+            return repr(error), {}
+        return self.api_wrapper.clean_results(response["results"]), response
+
+    async def _arun(
+        self, query: str, run_manager: AsyncCallbackManagerForToolRun | None = None
+    ) -> tuple[list[dict[str, str]] | str, dict]:
+        try:
+            response = await self.cache.search(query, self.max_results)
+        except Exception as error:
+            return repr(error), {}
+        return self.api_wrapper.clean_results(response["results"]), response
@@ -0,0 +1,93 @@
+import os
+import re
+import sqlite3
+import threading
+
+from app.core.cache import LRUCache
+from app.core.config import settings
+
+# Quoted string literals and identifiers, which must be kept verbatim when normalizing SQL
+SQL_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])""")
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Normalize SQL text so trivially different spellings of the same query share a cache key:
+    collapse whitespace, lowercase everything outside quotes and drop trailing semicolons.
+    """
+    parts = SQL_QUOTED.split(query.strip().rstrip(";").strip())
+    # `split` with a capturing group puts the quoted parts at the odd indexes
+    return "".join(part if index % 2 else re.sub(r"\s+", " ", part).lower() for index, part in enumerate(parts))
+
+
+class DataVersionMonitor:
+    """
+    Detects changes to the content and schema of a SQLite database file.
+
+    Uses `PRAGMA data_version` on a dedicated read-only connection, which changes whenever
+    another connection commits to the database, and the file modification time, which
+    catches the file being replaced.
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection | None:
+        if self._conn is None:
+            try:
+                self._conn = sqlite3.connect(f"file:{self.db_file}?mode=ro", uri=True, check_same_thread=False)
+            except sqlite3.OperationalError:
+                return None
+        return self._conn
+
+    def data_version(self) -> tuple[int, int]:
+        """Return a value that changes whenever the content of the database changes."""
+        try:
+            mtime = os.stat(self.db_file).st_mtime_ns
+        except FileNotFoundError:
+            mtime = 0
+        with self._lock:
+            conn = self._connection()
+            version = conn.execute("PRAGMA data_version").fetchone()[0] if conn is not None else 0
+        return version, mtime
+
+    def schema_version(self) -> int:
+        """Return the schema version, which changes whenever a table or index is created, altered or dropped."""
+        with self._lock:
+            conn = self._connection()
+            return conn.execute("PRAGMA schema_version").fetchone()[0] if conn is not None else 0
+
+
+class QueryResultCache:
+    """
+    Size-bounded LRU of SQL query results keyed on the normalized SQL text.
+    The whole cache is dropped as soon as the database reports a new data version.
+    """
+
+    def __init__(self, monitor: DataVersionMonitor, max_size: int = settings.sql_cache_size):
+        self.monitor = monitor
+        self.results: LRUCache[str, str] = LRUCache(max_size)
+        self.version: tuple[int, int] | None = None
+        self._lock = threading.Lock()
+
+    def lookup(self, query: str) -> tuple[tuple[int, int], str | None]:
+        """
+        Return the current data version and the cached result of the query, if any.
+        Pass the version back to `store` so results computed on stale data are not cached.
+        """
+        version = self.monitor.data_version()
+        with self._lock:
+            if version != self.version:
+                self.results.clear()
+                self.version = version
+        return version, self.results.get(normalize_sql(query))
+
+    def store(self, query: str, version: tuple[int, int], result: str) -> None:
+        with self._lock:
+            if version == self.version:
+                self.results.set(normalize_sql(query), result)
+
+    def stats(self) -> dict[str, int]:
+        return self.results.stats()
@@ -0,0 +1,273 @@
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from langchain_community.tools.sql_database.tool import (
+    BaseSQLDatabaseTool,
+    InfoSQLDatabaseTool,
+    ListSQLDatabaseTool,
+    QuerySQLDatabaseTool,
+)
+from langchain_community.utilities.sql_database import truncate_word
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
+from langchain_core.runnables.config import run_in_executor
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, Field
+from sqlalchemy import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.chatbot.schema_catalog import SchemaCatalog
+from app.chatbot.sql_cache import QueryResultCache
+from app.core.config import settings
+
+# Rows fetched from the cursor at a time
+FETCH_SIZE = 500
+# SQLite storage class of the values returned by the driver
+STORAGE_CLASSES = {int: "INTEGER", float: "REAL", str: "TEXT", bytes: "BLOB", type(None): "NULL"}
+
+# Authorizer actions of the statements allowed by the query checker: reading tables and calling functions
+READ_ACTIONS = frozenset(
+    {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+)
+# Statements of the authorizer actions the query checker denies first, named in its error message. Statements
+# changing the schema are denied on their write to the schema table, before their own action is authorized.
+DENIED_ACTIONS = {
+    sqlite3.SQLITE_INSERT: "INSERT",
+    sqlite3.SQLITE_UPDATE: "UPDATE",
+    sqlite3.SQLITE_DELETE: "DELETE",
+    sqlite3.SQLITE_PRAGMA: "PRAGMA",
+    sqlite3.SQLITE_TRANSACTION: "TRANSACTION",
+    sqlite3.SQLITE_SAVEPOINT: "SAVEPOINT",
+    sqlite3.SQLITE_ATTACH: "ATTACH",
+    sqlite3.SQLITE_DETACH: "DETACH",
+    sqlite3.SQLITE_ALTER_TABLE: "ALTER TABLE",
+    sqlite3.SQLITE_ANALYZE: "ANALYZE",
+    sqlite3.SQLITE_REINDEX: "REINDEX",
+    sqlite3.SQLITE_CREATE_VTABLE: "CREATE VIRTUAL TABLE",
+    sqlite3.SQLITE_DROP_VTABLE: "DROP VIRTUAL TABLE",
+}
+WRITE_ACTIONS = frozenset({sqlite3.SQLITE_INSERT, sqlite3.SQLITE_UPDATE, sqlite3.SQLITE_DELETE})
+SCHEMA_TABLES = frozenset({"sqlite_master", "sqlite_schema", "sqlite_temp_master", "sqlite_temp_schema"})
+
+# Runs the SQL tools, with a thread per pooled connection to the chatbot database so no thread waits for one
+tool_executor = ThreadPoolExecutor(settings.chatbot_db_pool_size, thread_name_prefix="sql-tool")
+
+
+class ResultPreview:
+    """
+    Bounded preview of a query result: keeps rows until the row or byte budget is spent,
+    then only counts the remaining rows and the types seen in every column.
+    """
+
+    def __init__(self, columns: list[str], max_rows: int, max_bytes: int, max_string_length: int = 300):
+        self.columns = columns
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_string_length = max_string_length
+        self.rows: list[tuple] = []
+        self.size = 0
+        self.row_count = 0
+        self.truncated_by: str | None = None
+        self.column_types: list[set[str]] = [set() for _ in columns]
+
+    def add(self, row: tuple) -> None:
+        self.row_count += 1
+        for types, value in zip(self.column_types, row, strict=True):
+            types.add(STORAGE_CLASSES.get(type(value), type(value).__name__))
+        if self.truncated_by is not None:
+            return
+        values = tuple(truncate_word(value, length=self.max_string_length) for value in row)
+        row_size = len(str(values)) + 2
+        if len(self.rows) >= self.max_rows:
+            self.truncated_by = "row"
+        elif self.size + row_size > self.max_bytes:
+            self.truncated_by = "byte"
+        else:
+            self.rows.append(values)
+            self.size += row_size
+
+    def summary(self) -> str:
+        columns = ", ".join(
+            f"{column} ({'/'.join(sorted(types)) or 'unknown'})"
+            for column, types in zip(self.columns, self.column_types, strict=True)
+        )
+        return (
+            f"[Result truncated by the {self.truncated_by} limit: showing {len(self.rows)} of {self.row_count} rows. "
+            f"Columns: {columns}. Use aggregates, filters or LIMIT to narrow the query.]"
+        )
+
+    def __str__(self) -> str:
+        if not self.rows and self.truncated_by is None:
+            return ""
+        if self.truncated_by is None:
+            return str(self.rows)
+        return f"{self.rows}\n{self.summary()}"
+
+
+def run_query_preview(engine: Engine, query: str, max_rows: int, max_bytes: int) -> str:
+    """
+    Run a query and format its result like `SQLDatabase.run`, streaming the rows so at most
+    `max_rows` rows and roughly `max_bytes` characters are kept, whatever the size of the result.
+    A truncated result ends with a summary of the total row count and the column types.
+    """
+    with engine.connect() as conn:
+        # The query is passed to the driver as is, so colons in string literals are not taken as bind parameters
+        result = conn.execution_options(stream_results=True).exec_driver_sql(query)
+        if not result.returns_rows:
+            return ""
+        preview = ResultPreview(list(result.keys()), max_rows, max_bytes)
+        for partition in result.partitions(FETCH_SIZE):
+            for row in partition:
+                preview.add(tuple(row))
+        return str(preview)
+
+
+class QueryAuthorizer:
+    """
+    SQLite authorizer recording the tables a statement reads while it is compiled, and denying
+    every other action, so a statement writing data or changing the schema fails to compile.
+    The first denied action is recorded with its arguments, to tell which statement was rejected.
+    """
+
+    def __init__(self):
+        self.tables: set[str] = set()
+        self.denied: tuple[int, str | None, str | None] | None = None
+
+    def __call__(self, action: int, first: str | None, second: str | None, *args: str | None) -> int:
+        if action == sqlite3.SQLITE_READ and first:
+            self.tables.add(first)
+        if action in READ_ACTIONS:
+            return sqlite3.SQLITE_OK
+        if self.denied is None:
+            self.denied = action, first, second
+        return sqlite3.SQLITE_DENY
+
+    def denied_statement(self) -> str:
+        """The statement of the denied action, e.g. `DELETE on properties`, `PRAGMA table_info` or `COMMIT`."""
+        action, first, second = self.denied
+        if action in WRITE_ACTIONS:
+            return "a schema change" if first in SCHEMA_TABLES else f"{DENIED_ACTIONS[action]} on {first}"
+        if action == sqlite3.SQLITE_TRANSACTION:
+            return str(first)
+        if action in (sqlite3.SQLITE_PRAGMA, sqlite3.SQLITE_SAVEPOINT):
+            return f"{DENIED_ACTIONS[action]} {first if action == sqlite3.SQLITE_PRAGMA else second}"
+        if action == sqlite3.SQLITE_ALTER_TABLE:
+            return f"ALTER TABLE on {second}"
+        return DENIED_ACTIONS.get(action, f"action {action}")
+
+
+def explain_error(query: str, error: sqlite3.Error, table_columns: dict[str, list[str]]) -> str:
+    """Format a compilation error, listing the tables or columns the query could have meant."""
+    message = str(error)
+    if message.startswith("no such table"):
+        return f"Error: {message}. Tables in the database: {', '.join(table_columns)}"
+    if message.startswith("no such column"):
+        columns = "; ".join(
+            f"{name}: {', '.join(columns)}"
+            for name, columns in table_columns.items()
+            if re.search(rf"\b{re.escape(name)}\b", query, re.IGNORECASE)
+        )
+        return f"Error: {message}. Columns of the tables in the query: {columns or 'none of the query tables exist'}"
+    return f"Error: {message}"
+
+
+def check_query(engine: Engine, query: str, table_columns: dict[str, list[str]]) -> str:
+    """
+    Check a query without running it, returning the query if it is valid or an error message otherwise.
+
+    SQLite compiles the query with `EXPLAIN`, failing on syntax errors, unknown tables or columns and wrong function
+    arguments, while a `QueryAuthorizer` rejects any statement other than a single SELECT. The tables read must be
+    tables of the schema catalog, which leaves out the internal `sqlite_` tables.
+    """
+    if not query.strip():
+        return "Error: the query is empty"
+    authorizer = QueryAuthorizer()
+    with engine.connect() as conn:
+        dbapi_connection = conn.connection.dbapi_connection
+        dbapi_connection.set_authorizer(authorizer)
+        try:
+            dbapi_connection.execute(f"EXPLAIN {query}").close()
+        except sqlite3.Error as error:
+            if authorizer.denied:
+                return f"Error: only SELECT queries can be run on the database, not {authorizer.denied_statement()}"
+            return explain_error(query, error, table_columns)
+        finally:
+            dbapi_connection.set_authorizer(None)
+    if unknown_tables := authorizer.tables - table_columns.keys():
+        tables = ", ".join(table_columns)
+        return f"Error: tables {sorted(unknown_tables)} cannot be queried. Tables in the database: {tables}"
+    return query
+
+
+class ExecutorToolMixin:
+    """
+    Runs a synchronous tool on `tool_executor` when it is called asynchronously, as the agent does,
+    rather than on the default executor of the event loop shared with the rest of the application.
+    The tool calls of an agent step run concurrently, up to the size of the executor.
+    """
+
+    async def _arun(self, *args: Any, run_manager: AsyncCallbackManagerForToolRun | None = None, **kwargs: Any) -> Any:
+        sync_run_manager = run_manager.get_sync() if run_manager else None
+        return await run_in_executor(tool_executor, self._run, *args, run_manager=sync_run_manager, **kwargs)
+
+
+class CachedQuerySQLDatabaseTool(ExecutorToolMixin, QuerySQLDatabaseTool):
+    """
+    `sql_db_query` tool that streams the result into a row- and byte-capped preview,
+    and serves repeated queries from a result cache until the database changes.
+    """
+
+    cache: QueryResultCache = Field(exclude=True)
+    max_rows: int = settings.sql_max_rows
+    max_bytes: int = settings.sql_max_result_bytes
+
+    def _run(self, query: str, run_manager: CallbackManagerForToolRun | None = None) -> Any:
+        version, result = self.cache.lookup(query)
+        if result is not None:
+            return result
+        try:
+            result = run_query_preview(self.db._engine, query, self.max_rows, self.max_bytes)
+        except SQLAlchemyError as error:
+            result = f"Error: {error}"
+        # Errors are not cached, the agent is expected to retry with a different query
+        if isinstance(result, str) and not result.startswith("Error:"):
+            self.cache.store(query, version, result)
+        return result
+
+
+class CatalogListSQLDatabaseTool(ExecutorToolMixin, ListSQLDatabaseTool):
+    """`sql_db_list_tables` tool served from the schema catalog."""
+
+    catalog: SchemaCatalog = Field(exclude=True)
+
+    def _run(self, tool_input: str = "", run_manager: CallbackManagerForToolRun | None = None) -> str:
+        return ", ".join(self.catalog.table_names())
+
+
+class CatalogInfoSQLDatabaseTool(ExecutorToolMixin, InfoSQLDatabaseTool):
+    """`sql_db_schema` tool served from the schema catalog."""
+
+    catalog: SchemaCatalog = Field(exclude=True)
+
+    def _run(self, table_names: str, run_manager: CallbackManagerForToolRun | None = None) -> str:
+        return self.catalog.table_info([name.strip() for name in table_names.split(",")])
+
+
+class QueryCheckerInput(BaseModel):
+    query: str = Field(..., description="A detailed SQL query to be checked.")
+
+
+class LocalQuerySQLCheckerTool(ExecutorToolMixin, BaseSQLDatabaseTool, BaseTool):
+    """
+    `sql_db_query_checker` tool validating queries locally with `check_query` against the database and the
+    schema catalog, rather than asking the model to review each query before it is run.
+    """
+
+    name: str = "sql_db_query_checker"
+    description: str = "Use this tool to double check if your query is correct before executing it."
+    args_schema: type[BaseModel] = QueryCheckerInput
+    catalog: SchemaCatalog = Field(exclude=True)
+
+    def _run(self, query: str, run_manager: CallbackManagerForToolRun | None = None) -> str:
+        return check_query(self.db._engine, query, self.catalog.table_columns())
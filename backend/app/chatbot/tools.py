@@ -1,31 +1,92 @@
 from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-from langchain_community.tools.tavily_search import TavilySearchResults
+from langchain_community.tools.sql_database.tool import (
+    InfoSQLDatabaseTool,
+    ListSQLDatabaseTool,
+    QuerySQLCheckerTool,
+    QuerySQLDatabaseTool,
+)
 from langchain_community.utilities.sql_database import SQLDatabase
-from sqlalchemy import create_engine
-from sqlalchemy.pool import StaticPool
+from langchain_community.utilities.tavily_search import TavilySearchAPIWrapper
+from langchain_core.tools import BaseTool
+from sqlalchemy import Engine, create_engine, event
+from sqlalchemy.pool import QueuePool
 
-from app.chatbot.model import model
+from app.chatbot.model import fast_model
+from app.chatbot.schema_catalog import SchemaCatalog
+from app.chatbot.search_cache import CachedTavilySearchResults, SearchCache, StubSearchBackend, TavilySearchBackend
+from app.chatbot.sql_cache import DataVersionMonitor, QueryResultCache
+from app.chatbot.sql_tools import (
+    CachedQuerySQLDatabaseTool,
+    CatalogInfoSQLDatabaseTool,
+    CatalogListSQLDatabaseTool,
+    LocalQuerySQLCheckerTool,
+)
 from app.core.config import settings
 
+# Pragmas applied to every pooled connection to the chatbot database
+DATABASE_PRAGMAS = (
+    "PRAGMA query_only = ON",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
 
-def get_database_engine():
-    """Get the database engine for SQLite."""
-    return create_engine(
-        f"sqlite:///{settings.chatbot_db_file}",
+
+def apply_database_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    for pragma in DATABASE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def get_database_engine() -> Engine:
+    """
+    Get the engine for the SQLite database queried by the chatbot.
+    Connections are opened read-only and pooled, so tool calls from concurrent conversations run in parallel.
+    """
+    engine = create_engine(
+        f"sqlite:///file:{settings.chatbot_db_file}?mode=ro&uri=true",
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
+        poolclass=QueuePool,
+        pool_size=settings.chatbot_db_pool_size,
+        max_overflow=0,
     )
+    event.listen(engine, "connect", apply_database_pragmas)
+    return engine
 
 
 engine = get_database_engine()
-database = SQLDatabase(engine)
+# Tables are described by the schema catalog, so SQLDatabase does not need to reflect them upfront
+database = SQLDatabase(engine, lazy_table_reflection=True)
+
+
+database_toolkit = SQLDatabaseToolkit(db=database, llm=fast_model)
+
+database_monitor = DataVersionMonitor(settings.chatbot_db_file)
+query_cache = QueryResultCache(database_monitor)
+schema_catalog = SchemaCatalog(engine, database_monitor)
+
 
+def replace_database_tool(tool: BaseTool) -> BaseTool:
+    """Swap a toolkit tool for the variant served from the query cache or the schema catalog, or checked locally."""
+    if isinstance(tool, QuerySQLDatabaseTool):
+        return CachedQuerySQLDatabaseTool(db=database, cache=query_cache, description=tool.description)
+    if isinstance(tool, InfoSQLDatabaseTool):
+        return CatalogInfoSQLDatabaseTool(db=database, catalog=schema_catalog, description=tool.description)
+    if isinstance(tool, ListSQLDatabaseTool):
+        return CatalogListSQLDatabaseTool(db=database, catalog=schema_catalog, description=tool.description)
+    if isinstance(tool, QuerySQLCheckerTool):
+        return LocalQuerySQLCheckerTool(db=database, catalog=schema_catalog, description=tool.description)
+    return tool
 
-database_toolkit = SQLDatabaseToolkit(db=database, llm=model)
 
-database_tools = database_toolkit.get_tools()
+database_tools = [replace_database_tool(tool) for tool in database_toolkit.get_tools()]
 
-search_tool = TavilySearchResults(max_results=2, tavily_api_key=settings.TAVILY_API_KEY)
+search_api = TavilySearchAPIWrapper(tavily_api_key=settings.TAVILY_API_KEY)
+search_backend = StubSearchBackend() if settings.search_backend == "stub" else TavilySearchBackend(search_api)
+search_cache = SearchCache(search_backend)
+search_tool = CachedTavilySearchResults(max_results=2, api_wrapper=search_api, cache=search_cache)
 search_tool.name = "search_tool"
 search_tool.description = "Search for relevant information in the internet."
 
@@ -1,3 +1,6 @@
+import json
+from typing import Any
+
 from markdown_it import MarkdownIt
 
 md = MarkdownIt()
@@ -9,3 +12,23 @@ def render_markdown_to_html(text: str) -> str:
     """
     text = md.render(text).replace("\n", "<br>")
     return text
+
+
+def message_text(content: str | list[str | dict]) -> str:
+    """
+    Extract the plain text of a message content, which may be a list of content blocks.
+    """
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block if isinstance(block, str) else block.get("text", "")
+        for block in content
+        if isinstance(block, str) or block.get("type") == "text"
+    )
+
+
+def format_sse_event(event: str, data: Any) -> str:
+    """
+    Format an event as a Server-Sent Events frame with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,45 @@
+import time
+from uuid import UUID
+
+import jwt
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import security
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models import TokenPayload, User
+
+# Decoded access tokens, kept until they expire or the cache TTL runs out
+tokens: TTLCache[str, TokenPayload] = TTLCache(settings.auth_cache_size, settings.auth_cache_ttl)
+# Column values of recently authenticated users, dropped by `invalidate_user` whenever a user changes.
+# Other processes only see a change once the TTL runs out
+users: TTLCache[UUID, dict] = TTLCache(settings.auth_cache_size, settings.auth_cache_ttl)
+
+
+def decode_token(token: str) -> TokenPayload:
+    """Decode and validate an access token, raising `jwt.InvalidTokenError` or `ValidationError` if invalid."""
+    if (token_data := tokens.get(token)) is not None:
+        return token_data
+    payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[security.ALGORITHM])
+    token_data = TokenPayload(**payload)
+    tokens.set(token, token_data, ttl=payload["exp"] - time.time() if "exp" in payload else None)
+    return token_data
+
+
+async def get_user(session: AsyncSession, user_id: UUID) -> User | None:
+    """
+    Get a user by ID, from the cache when possible.
+    The returned user is a copy not attached to any session, load it from the session to modify it.
+    """
+    if (data := users.get(user_id)) is not None:
+        return User.model_validate(data)
+    user = await session.get(User, user_id)
+    if user is None:
+        return None
+    data = user.model_dump()
+    users.set(user_id, data)
+    return User.model_validate(data)
+
+
+def invalidate_user(user_id: UUID) -> None:
+    users.pop(user_id)
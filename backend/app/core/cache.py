@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Generic, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class LRUCache(Generic[K, V]):
+    """Thread-safe, size-bounded least-recently-used cache with hit/miss counters."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, V] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: K, value: V) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def touch(self, key: K) -> None:
+        """Mark the entry as the most recently used, if still cached, without counting a hit or a miss."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+
+    def pop(self, key: K) -> V | None:
+        with self._lock:
+            return self._data.pop(key, None)
+
+    def items(self) -> list[tuple[K, V]]:
+        """Snapshot of the cached items, least recently used first, without touching their recency."""
+        with self._lock:
+            return list(self._data.items())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._data), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+class TTLCache(Generic[K, V]):
+    """Size-bounded least-recently-used cache whose entries also expire after a time to live, in seconds."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.ttl = ttl
+        self.entries: LRUCache[K, tuple[float, V]] = LRUCache(max_size)
+
+    def get(self, key: K) -> V | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            self.entries.pop(key)
+            return None
+        return value
+
+    def set(self, key: K, value: V, ttl: float | None = None) -> None:
+        """Cache a value for `ttl` seconds, or the cache's time to live if shorter or not given."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl > 0:
+            self.entries.set(key, (time.monotonic() + ttl, value))
+
+    def pop(self, key: K) -> V | None:
+        entry = self.entries.pop(key)
+        return entry[1] if entry is not None else None
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def stats(self) -> dict[str, int]:
+        return self.entries.stats()
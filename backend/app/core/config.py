@@ -1,3 +1,4 @@
+import os
 from functools import lru_cache
 from pathlib import Path
 from typing import Literal
@@ -8,7 +9,6 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent.resolve()
 USER_HOME = Path.home()
 APP_DATA_DIR = USER_HOME / ".askdb"
-APP_DATA_DIR.mkdir(exist_ok=True)
 
 model_name_options = Literal["gemini-2.5-pro-exp-03-25", "gemini-2.0-flash-lite", "gemini-2.0-flash"]
 
@@ -22,12 +22,65 @@ class Settings(BaseSettings):
 
     # Memory DB path for chatbot
     memory_db_path: str = str(APP_DATA_DIR / "checkpoints.sqlite")
-
-    # Model name for the chatbot
+    # Memory DB path for the CLI conversations, which are not threads of the API
+    cli_memory_db_path: str = str(APP_DATA_DIR / "cli_checkpoints.sqlite")
+    # Number of pooled reader connections to the memory DB
+    memory_db_readers: int = 4
+    # Cache of chat messages rendered to HTML, persisted next to the memory DB
+    render_cache_db_path: str = str(APP_DATA_DIR / "rendered_messages.sqlite")
+    render_cache_size: int = 4096
+    # Checkpoints kept per thread, and the interval (in seconds) and page budget of the background compaction
+    checkpoint_keep_last: int = 1
+    checkpoint_compaction_interval: float = 300
+    checkpoint_vacuum_pages: int = 1000
+
+    # System prompt cache, and whether to refresh it from the LangChain hub in the background on startup
+    prompt_cache_path: str = str(APP_DATA_DIR / "sql_agent_system_prompt.json")
+    prompt_hub_refresh: bool = False
+
+    # Model for complex questions and steps after a failed attempt, and the faster model for the other steps
+    # (the same name disables routing). A turn taking more than `model_escalation_steps` steps is escalated
     model_name: model_name_options | str = "gemini-2.5-pro-exp-03-25"  # default model
+    fast_model_name: model_name_options | str = "gemini-2.0-flash-lite"
+    model_escalation_steps: int = 4
+    # Client-side quotas of the model calls (0 for no limit), the most calls in flight the adaptive limit
+    # can reach, the latency (in seconds) above which it backs off, and the retries of overloaded calls
+    model_requests_per_minute: float = 60
+    model_tokens_per_minute: float = 1_000_000
+    model_max_concurrency: int = 8
+    model_latency_target: float = 20
+    model_max_retries: int = 4
+
+    # Context sent to the model: the last turns kept verbatim, their token budget and the characters
+    # kept from the tool outputs of the previous turns. Older messages are replaced by a rolling summary
+    context_max_turns: int = 6
+    context_max_tokens: int = 12_000
+    context_tool_output_chars: int = 1_000
 
     # Chatbot database file
     chatbot_db_file: str = "realestate.db"
+    # Number of pooled read-only connections to the chatbot database, and of threads running the SQL tools
+    chatbot_db_pool_size: int = min(32, (os.cpu_count() or 1) + 4)
+    # Number of SQL query results cached for the chatbot database
+    sql_cache_size: int = 256
+    # Row and size (in characters) budget of the SQL query results passed to the chatbot
+    sql_max_rows: int = 100
+    sql_max_result_bytes: int = 16_000
+    # Number of chatbot answers cached for repeated questions, and the similarity a question needs to reuse one
+    answer_cache_size: int = 512
+    answer_cache_threshold: float = 0.85
+    # Web search backend ("stub" answers locally, for tests), and the search results cached, persisted
+    # next to the memory DB, and for how long (in seconds)
+    search_backend: Literal["tavily", "stub"] = "tavily"
+    search_cache_db_path: str = str(APP_DATA_DIR / "search_results.sqlite")
+    search_cache_size: int = 256
+    search_cache_ttl: float = 3600
+    # Workers running background chat jobs, the jobs a user can have queued or running at once,
+    # and the number of finished jobs kept for polling and for how long (in seconds)
+    chat_job_workers: int = 4
+    chat_job_max_per_user: int = 4
+    chat_job_results_size: int = 1024
+    chat_job_result_ttl: float = 3600
 
     # API Keys
     GOOGLE_API_KEY: str
@@ -37,12 +90,21 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8  # 8 days
     EMAIL_RESET_TOKEN_EXPIRE_HOURS: int = 24  # 1 day
+    # Processes hashing and verifying passwords, and the operations admitted at once before rejecting new ones
+    password_hash_workers: int = max(1, (os.cpu_count() or 1) // 2)
+    password_hash_max_pending: int = 64
+    # Decoded tokens and users cached by the authentication dependency, and for how long (in seconds)
+    auth_cache_size: int = 1024
+    auth_cache_ttl: float = 60
 
     # BACKEND_CORS_ORIGINS is a comma-separated list of origins
     all_cors_origins: list[str] = ["http://localhost:3000", "http://127.0.1:3000"]
 
     # Database
     SQLALCHEMY_DATABASE_URI: str = f"sqlite:///{APP_DATA_DIR}/askdb.db"
+    # Pooled connections to the database, and the connections opened beyond them under load
+    database_pool_size: int = 10
+    database_max_overflow: int = 10
 
     # First superuser
     FIRST_SUPERUSER: str = "admin@askdb.com"
@@ -58,6 +120,11 @@ class Settings(BaseSettings):
     )
 
 
+def create_app_data_dir() -> None:
+    """Create the directory holding the default database and cache files, on startup rather than on import."""
+    APP_DATA_DIR.mkdir(exist_ok=True)
+
+
 @lru_cache
 def get_settings() -> Settings:
     return Settings()
@@ -1,10 +1,59 @@
-from sqlmodel import Session, SQLModel, create_engine, select
+from sqlalchemy import Connection, event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app import crud
 from app.core.config import settings
-from app.models import User, UserCreate
+from app.models import Thread, User, UserCreate
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), echo=False)
+# Async drivers used for the dialects of `SQLALCHEMY_DATABASE_URI`
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+def async_database_uri(uri: str) -> str:
+    """Return the URI with the async driver of its dialect, unless it already names a driver."""
+    scheme, separator, rest = uri.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{separator}{rest}"
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def create_database_engine() -> AsyncEngine:
+    engine = create_async_engine(
+        async_database_uri(str(settings.SQLALCHEMY_DATABASE_URI)),
+        echo=False,
+        pool_size=settings.database_pool_size,
+        max_overflow=settings.database_max_overflow,
+    )
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", apply_sqlite_pragmas)
+    return engine
+
+
+engine = create_database_engine()
+
+
+def create_session() -> AsyncSession:
+    # Committed objects are not expired, since an async session cannot reload their attributes on access
+    return AsyncSession(engine, expire_on_commit=False)
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -12,20 +61,27 @@ engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), echo=False)
 # for more details: https://github.com/fastapi/full-stack-fastapi-template/issues/28
 
 
-def init_db(session: Session) -> None:
+def create_tables(connection: Connection) -> None:
+    # This works because the models are already imported and registered from app.models
+    SQLModel.metadata.create_all(connection)
+    # create_all skips the tables that already exist, indexes added since then are created here
+    for index in Thread.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+async def init_db(session: AsyncSession) -> None:
     # Tables should be created with Alembic migrations
     # But if you don't want to use migrations, create
     # the tables un-commenting the next lines
     # from sqlmodel import SQLModel
+    async with engine.begin() as connection:
+        await connection.run_sync(create_tables)
 
-    # This works because the models are already imported and registered from app.models
-    SQLModel.metadata.create_all(engine)
-
-    user = session.exec(select(User).where(User.email == settings.FIRST_SUPERUSER)).first()
+    user = (await session.exec(select(User).where(User.email == settings.FIRST_SUPERUSER))).first()
     if not user:
         user_in = UserCreate(
             email=settings.FIRST_SUPERUSER,
             password=settings.FIRST_SUPERUSER_PASSWORD,
             is_superuser=True,
         )
-        user = crud.create_user(session=session, user_create=user_in)
+        user = await crud.create_user(session=session, user_create=user_in)
@@ -1,5 +1,10 @@
+import asyncio
+import multiprocessing
+import threading
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
 from datetime import UTC, datetime, timedelta
-from typing import Any
+from typing import Any, TypeVar
 
 import jwt
 from passlib.context import CryptContext
@@ -11,6 +16,8 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 ALGORITHM = "HS256"
 
+T = TypeVar("T")
+
 
 def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     expire = datetime.now(UTC) + expires_delta
@@ -25,3 +32,59 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+class PasswordHashingBusyError(Exception):
+    """Raised when too many password hashes or verifications are already running or queued."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated process pool, so hashing does not hold the request threads or the GIL.
+
+    At most `max_pending` operations are admitted at once (running or queued on the pool),
+    beyond that `PasswordHashingBusyError` is raised instead of queuing more work.
+    The pool is started on first use.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # Forking a process running threads and an event loop is unsafe, workers start from a fresh interpreter
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    async def run(self, function: Callable[..., T], *args: Any) -> T:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise PasswordHashingBusyError("Too many password operations in progress, try again later")
+            self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool(), function, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+
+password_hasher = PasswordHasher(settings.password_hash_workers, settings.password_hash_max_pending)
+
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+
+async def aget_password_hash(password: str) -> str:
+    return await password_hasher.run(get_password_hash, password)
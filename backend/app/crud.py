@@ -1,52 +1,62 @@
 import uuid
 from typing import Any
 
-from sqlmodel import Session, select
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core.security import get_password_hash, verify_password
+from app.core.auth_cache import invalidate_user
+from app.core.security import aget_password_hash, averify_password
 from app.models import Thread, ThreadCreate, User, UserCreate, UserUpdate
 
 
-def create_user(*, session: Session, user_create: UserCreate) -> User:
-    db_obj = User.model_validate(user_create, update={"hashed_password": get_password_hash(user_create.password)})
+async def create_user(*, session: AsyncSession, user_create: UserCreate) -> User:
+    hashed_password = await aget_password_hash(user_create.password)
+    db_obj = User.model_validate(user_create, update={"hashed_password": hashed_password})
     session.add(db_obj)
-    session.commit()
-    session.refresh(db_obj)
+    await session.commit()
+    await session.refresh(db_obj)
     return db_obj
 
 
-def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
+async def update_user(*, session: AsyncSession, db_user: User, user_in: UserUpdate) -> Any:
     user_data = user_in.model_dump(exclude_unset=True)
     extra_data = {}
     if "password" in user_data:
         password = user_data["password"]
-        hashed_password = get_password_hash(password)
+        hashed_password = await aget_password_hash(password)
         extra_data["hashed_password"] = hashed_password
     db_user.sqlmodel_update(user_data, update=extra_data)
     session.add(db_user)
-    session.commit()
-    session.refresh(db_user)
+    await session.commit()
+    invalidate_user(db_user.id)
+    await session.refresh(db_user)
     return db_user
 
 
-def get_user_by_email(*, session: Session, email: str) -> User | None:
+async def get_user_by_email(*, session: AsyncSession, email: str) -> User | None:
     statement = select(User).where(User.email == email)
-    session_user = session.exec(statement).first()
+    session_user = (await session.exec(statement)).first()
     return session_user
 
 
-def authenticate(*, session: Session, email: str, password: str) -> User | None:
-    db_user = get_user_by_email(session=session, email=email)
+async def authenticate(*, session: AsyncSession, email: str, password: str) -> User | None:
+    db_user = await get_user_by_email(session=session, email=email)
     if not db_user:
         return None
-    if not verify_password(password, db_user.hashed_password):
+    # End the read transaction, so logins waiting on bcrypt do not hold a connection of the pool each
+    await session.commit()
+    if not await averify_password(password, db_user.hashed_password):
         return None
     return db_user
 
 
-def create_thread(*, session: Session, thread_in: ThreadCreate, user_id: uuid.UUID) -> Thread:
+async def create_thread(*, session: AsyncSession, thread_in: ThreadCreate, user_id: uuid.UUID) -> Thread:
     db_thread = Thread.model_validate(thread_in, update={"user_id": user_id})
     session.add(db_thread)
-    session.commit()
-    session.refresh(db_thread)
+    await session.commit()
+    await session.refresh(db_thread)
     return db_thread
+
+
+async def get_thread_ids(*, session: AsyncSession) -> set[str]:
+    return {str(thread_id) for thread_id in (await session.exec(select(Thread.id))).all()}
@@ -1,14 +1,17 @@
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
 from scalar_fastapi import get_scalar_api_reference
-from sqlmodel import Session
 from starlette.middleware.cors import CORSMiddleware
 
+from app import crud
 from app.api.main import api_router
-from app.core.config import settings
-from app.core.database import engine, init_db
+from app.chatbot.jobs import run_job_queue
+from app.core.config import create_app_data_dir, settings
+from app.core.database import create_session, engine, init_db
+from app.core.security import PasswordHashingBusyError, password_hasher
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -17,12 +20,37 @@ def custom_generate_unique_id(route: APIRoute) -> str:
     return f"{route.name}"
 
 
+async def read_thread_ids() -> set[str]:
+    async with create_session() as session:
+        return await crud.get_thread_ids(session=session)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    with Session(engine) as session:
-        init_db(session=session)
-    yield
+    create_app_data_dir()
+    async with create_session() as session:
+        await init_db(session=session)
+    # The chatbot stack (Gemini client, SQL tools, checkpoint store) is imported here rather than at module level,
+    # so importing the application, as the CLI, tests and workers do, stays cheap
+    from app.chatbot.chatbot_core import open_chatbot
+    from app.chatbot.compaction import run_checkpoint_compactor
+    from app.chatbot.prompt import refresh_prompt_in_background
+
+    if settings.prompt_hub_refresh:
+        refresh_prompt_in_background()
+    try:
+        async with (
+            open_chatbot() as chatbot,
+            run_checkpoint_compactor(chatbot.memory, read_thread_ids),
+            run_job_queue(chatbot.process_message) as jobs,
+        ):
+            app.state.chatbot = chatbot
+            app.state.jobs = jobs
+            yield
+    finally:
+        password_hasher.shutdown()
+        await engine.dispose()
 
 
 app = FastAPI(
@@ -47,6 +75,11 @@ if settings.all_cors_origins:
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
 
+@app.exception_handler(PasswordHashingBusyError)
+async def password_hashing_busy_handler(request: Request, error: PasswordHashingBusyError) -> JSONResponse:
+    return JSONResponse(status_code=503, content={"detail": str(error)}, headers={"Retry-After": "1"})
+
+
 @app.get("/scalar", include_in_schema=False)
 async def scalar_html():
     return get_scalar_api_reference(
@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Literal
 from uuid import UUID, uuid4
 
 import sqlalchemy as sa
@@ -88,6 +89,13 @@ class ThreadUpdate(SQLModel):
 
 
 class Thread(ThreadBase, TimestampMixin, table=True):
+    # Threads are listed newest first with `id` breaking ties, these indexes serve the listing and its cursor
+    # without sorting, for a user and for superusers listing every thread
+    __table_args__ = (
+        sa.Index("ix_thread_user_id_created_at", "user_id", "created_at", "id"),
+        sa.Index("ix_thread_created_at", "created_at", "id"),
+    )
+
     id: UUID = Field(default_factory=uuid4, primary_key=True, index=True)
     user_id: UUID = Field(foreign_key="user.id", nullable=False, ondelete="CASCADE")
     user: User | None = Relationship(back_populates="threads")
@@ -102,7 +110,14 @@ class ThreadPublic(ThreadBase):
 
 class ThreadsPublic(SQLModel):
     data: list[ThreadPublic]
-    count: int
+    count: int | None = Field(
+        default=None,
+        description="Total number of threads, only when requested with `include_count`",
+    )
+    next_cursor: str | None = Field(
+        default=None,
+        description="Cursor to pass as `before` to fetch the next page, if there are older threads",
+    )
 
 
 # Generic response
@@ -111,6 +126,7 @@ class Response(SQLModel):
 
 
 class Message(SQLModel):
+    id: str | None = Field(default=None)
     role: str | None = Field(default=None)
     content: str
 
@@ -132,6 +148,16 @@ class ChatHistoryRequest(SQLModel):
         default=None,
         description="Thread ID for the conversation",
     )
+    before: str | None = Field(
+        default=None,
+        description="Only return messages older than the message with this ID (pagination cursor)",
+    )
+    limit: int | None = Field(
+        default=None,
+        ge=1,
+        le=200,
+        description="Maximum number of messages to return, starting from the most recent (all if omitted)",
+    )
 
 
 class ChatHistory(SQLModel):
@@ -142,6 +168,18 @@ class ChatHistory(SQLModel):
     messages: list[Message] = Field(
         description="List of messages in the chat history",
     )
+    next_cursor: str | None = Field(
+        default=None,
+        description="Cursor to pass as `before` to fetch the previous page, if there are older messages",
+    )
+
+
+class ChatJob(SQLModel):
+    id: UUID = Field(description="Job ID, to poll the job or follow it over a WebSocket")
+    thread_id: UUID
+    status: Literal["queued", "running", "done", "failed"]
+    response: str | None = Field(default=None, description="The chatbot response as HTML, once done")
+    error: str | None = Field(default=None, description="Why the job failed, if it did")
 
 
 # JSON payload containing access token
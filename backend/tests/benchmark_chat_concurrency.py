@@ -0,0 +1,109 @@
+"""
+Compare how many chat turns the sync and async agent pipelines keep in flight.
+
+The sync pipeline mirrors the old `def chat_endpoint`: every turn runs `agent.invoke` with a
+`SqliteSaver` on a worker of a 40-thread pool (Starlette's default threadpool size).
+The async pipeline runs `agent.ainvoke` with an `AsyncSqliteSaver` on a single event loop.
+Both use a fake chat model that waits `LLM_LATENCY` seconds per call instead of calling Gemini.
+
+Usage: uv run python tests/benchmark_chat_concurrency.py [conversations]
+"""
+
+import asyncio
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import aiosqlite
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.tools import tool
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.prebuilt import create_react_agent
+
+LLM_LATENCY = 0.5
+THREADPOOL_SIZE = 40
+
+
+@tool
+def sql_db_list_tables(tool_input: str = "") -> str:
+    """List the tables in the database."""
+    return "clients, client_properties, properties"
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model that asks for one tool call and then answers, after a fixed latency."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _respond(self, messages) -> ChatResult:
+        if isinstance(messages[-1], HumanMessage):
+            message = AIMessage(content="", tool_calls=[{"name": "sql_db_list_tables", "args": {}, "id": "call"}])
+        else:
+            message = AIMessage(content="There are 3 tables.")
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(LLM_LATENCY)
+        return self._respond(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(LLM_LATENCY)
+        return self._respond(messages)
+
+
+def run_sync(db_path: Path, conversations: int) -> float:
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    agent = create_react_agent(FakeChatModel(), [sql_db_list_tables], checkpointer=SqliteSaver(conn))
+
+    def turn(index: int) -> None:
+        config = {"configurable": {"thread_id": f"sync-{index}"}}
+        agent.invoke({"messages": [{"role": "user", "content": "How many tables?"}]}, config)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADPOOL_SIZE) as executor:
+        list(executor.map(turn, range(conversations)))
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+async def run_async(db_path: Path, conversations: int) -> float:
+    async with aiosqlite.connect(db_path) as conn:
+        agent = create_react_agent(FakeChatModel(), [sql_db_list_tables], checkpointer=AsyncSqliteSaver(conn))
+
+        async def turn(index: int) -> None:
+            config = {"configurable": {"thread_id": f"async-{index}"}}
+            await agent.ainvoke({"messages": [{"role": "user", "content": "How many tables?"}]}, config)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(turn(index) for index in range(conversations)))
+        return time.perf_counter() - start
+
+
+def main() -> None:
+    conversations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    ideal = 2 * LLM_LATENCY
+    print(f"{conversations} concurrent conversations, 2 LLM calls of {LLM_LATENCY}s each per turn")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sync_elapsed = run_sync(Path(tmp_dir) / "sync.sqlite", conversations)
+        async_elapsed = asyncio.run(run_async(Path(tmp_dir) / "async.sqlite", conversations))
+    for label, elapsed in (("sync  (invoke, threadpool)", sync_elapsed), ("async (ainvoke)", async_elapsed)):
+        print(
+            f"{label:<28} {elapsed:6.2f}s  {conversations / elapsed:7.1f} turns/s  "
+            f"~{min(conversations, conversations * ideal / elapsed):5.0f} turns in flight"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Check that importing the API application stays within a startup-time budget.
+
+Runs `python -X importtime -c "import app.main"` in a fresh interpreter, a few times, and takes the
+fastest cumulative import time of `app.main`. Also checks that none of the chatbot stack (Gemini client,
+LangChain tools, LangGraph) is imported, since it is only loaded by the FastAPI lifespan.
+Exits with status 1 when the budget is exceeded or a heavy module is imported.
+
+The budget is `BASELINE_TOLERANCE` above the baseline recorded on this machine with `--record`, or
+`IMPORT_BUDGET_MS` (just above the import time measured when it was set) if none was recorded.
+
+Usage: uv run python tests/benchmark_import_time.py [--record | budget_ms]
+"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+IMPORT_BUDGET_MS = 950
+# Import time recorded with `--record`, kept out of version control as it depends on the machine
+BASELINE_PATH = Path(__file__).parent / "import_time_baseline.json"
+BASELINE_TOLERANCE = 1.1
+RUNS = 3
+# Modules that must only be imported when the application starts
+LAZY_MODULES = (
+    "app.chatbot.chatbot_core",
+    "langchain_google_genai",
+    "langchain_community",
+    "langgraph",
+    "tavily",
+)
+CHECK_LAZY_MODULES = "import sys, app.main; print(','.join(m for m in {modules!r} if m in sys.modules))"
+
+
+def parse_importtime(stderr: str) -> list[tuple[int, int, str]]:
+    """Parse `-X importtime` lines into `(self_us, cumulative_us, module)` tuples."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line.removeprefix("import time:").split("|")
+        imports.append((int(self_us), int(cumulative_us), module.strip()))
+    return imports
+
+
+def measure() -> list[tuple[int, int, str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def default_budget_ms() -> float:
+    try:
+        return json.loads(BASELINE_PATH.read_text())["app.main_ms"] * BASELINE_TOLERANCE
+    except (OSError, ValueError, KeyError):
+        return IMPORT_BUDGET_MS
+
+
+def main() -> None:
+    record = sys.argv[1:] == ["--record"]
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 and not record else default_budget_ms()
+    runs = [measure() for _ in range(RUNS)]
+    imports = min(runs, key=lambda run: next(cumulative for _, cumulative, module in run if module == "app.main"))
+    total_ms = next(cumulative for _, cumulative, module in imports if module == "app.main") / 1000
+
+    print("Slowest imports (self time):")
+    for self_us, cumulative_us, module in sorted(imports, reverse=True)[:15]:
+        print(f"  {self_us / 1000:8.1f} ms self {cumulative_us / 1000:8.1f} ms cumulative  {module}")
+
+    result = subprocess.run(
+        [sys.executable, "-c", CHECK_LAZY_MODULES.format(modules=LAZY_MODULES)],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    eager_modules = [module for module in result.stdout.strip().split(",") if module]
+
+    if record:
+        BASELINE_PATH.write_text(json.dumps({"app.main_ms": total_ms}))
+        budget_ms = total_ms * BASELINE_TOLERANCE
+        print(f"Recorded the baseline in {BASELINE_PATH.name}")
+    print(f"import app.main: {total_ms:.1f} ms (budget {budget_ms:.0f} ms, best of {RUNS})")
+    failed = False
+    if total_ms > budget_ms:
+        print("FAIL: import time over budget")
+        failed = True
+    if eager_modules:
+        print(f"FAIL: imported on module load instead of in the lifespan: {', '.join(eager_modules)}")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Measure login throughput, and how a burst of logins slows the other requests down.
+
+Runs `LOGINS` concurrent `crud.authenticate` calls against a temporary user database, in two modes:
+- inline: bcrypt runs on a 40-thread pool (Starlette's default threadpool size), as the sync
+  `login_access_token` endpoint used to do
+- pool: bcrypt runs on the password hashing process pool through the async `crud.authenticate`
+While the logins run, a probe stands in for chat traffic: it repeatedly runs a trivial function on the
+same threadpool and records the round-trip latency.
+
+Usage: uv run python tests/benchmark_login_throughput.py [logins]
+"""
+
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.core.security import get_password_hash, password_hasher, verify_password
+from app.models import User
+
+LOGINS = 64
+THREADPOOL_SIZE = 40
+EMAIL = "benchmark@askdb.com"
+PASSWORD = "benchmark-password"
+
+
+async def inline_authenticate(engine, threadpool: ThreadPoolExecutor) -> User | None:
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        user = await crud.get_user_by_email(session=session, email=EMAIL)
+    if not user:
+        return None
+    loop = asyncio.get_running_loop()
+    valid = await loop.run_in_executor(threadpool, verify_password, PASSWORD, user.hashed_password)
+    return user if valid else None
+
+
+async def pool_authenticate(engine) -> User | None:
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        return await crud.authenticate(session=session, email=EMAIL, password=PASSWORD)
+
+
+async def probe(threadpool: ThreadPoolExecutor, done: asyncio.Event) -> list[float]:
+    loop = asyncio.get_running_loop()
+    latencies = []
+    while not done.is_set():
+        start = time.perf_counter()
+        await loop.run_in_executor(threadpool, lambda: None)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+async def run(mode: str, engine, logins: int) -> None:
+    threadpool = ThreadPoolExecutor(THREADPOOL_SIZE)
+    done = asyncio.Event()
+    probe_task = asyncio.create_task(probe(threadpool, done))
+
+    start = time.perf_counter()
+    if mode == "inline":
+        users = await asyncio.gather(*(inline_authenticate(engine, threadpool) for _ in range(logins)))
+    else:
+        users = await asyncio.gather(*(pool_authenticate(engine) for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    latencies = sorted(await probe_task)
+    threadpool.shutdown()
+
+    assert all(users), "every login should succeed"
+    p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0
+    print(
+        f"{mode:>6}: {logins} logins in {elapsed:.2f}s ({logins / elapsed:.1f}/s), "
+        f"probe latency p50 {statistics.median(latencies) * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms"
+    )
+
+
+async def benchmark(database: Path, logins: int) -> None:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{database}")
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        session.add(User(email=EMAIL, hashed_password=get_password_hash(PASSWORD)))
+        await session.commit()
+
+    # Start the worker processes before measuring
+    await password_hasher.run(len, "")
+    for mode in ("inline", "pool"):
+        await run(mode, engine, logins)
+    await engine.dispose()
+
+
+def main() -> None:
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else LOGINS
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            asyncio.run(benchmark(Path(directory) / "users.db", logins))
+        finally:
+            password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Measure how many agent turns survive a burst against a rate-limited Gemini, with and without the client-side limiter.
+
+A fake Gemini async client stands in for the API. It serves `UPSTREAM_RPS` requests per second and
+`UPSTREAM_CONCURRENCY` calls at once, answers 429 (`ResourceExhausted`) beyond the rate and 503
+(`ServiceUnavailable`) beyond the concurrency, and slows down as more calls are in flight.
+`TURNS` concurrent turns each make `CALLS_PER_TURN` sequential model calls, like a ReAct loop. A turn is
+lost as soon as one of its calls fails, after the retries of the model client. Two runs are compared:
+- plain: `ChatGoogleGenerativeAI`, with only the retry built into langchain-google-genai
+- limited: `RateLimitedChatGoogleGenerativeAI`, with a limiter set to the upstream quota and burst
+
+Usage: uv run python tests/benchmark_model_rate_limit.py [turns]
+"""
+
+import asyncio
+import sys
+import time
+
+from google.ai.generativelanguage_v1beta.types import Candidate, Content, GenerateContentResponse, Part
+from google.api_core import exceptions
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from app.chatbot import model as model_module
+from app.chatbot.model import RateLimitedChatGoogleGenerativeAI
+from app.chatbot.rate_limit import RateLimiter, TokenBucket
+
+TURNS = 24
+CALLS_PER_TURN = 3
+UPSTREAM_RPS = 4
+UPSTREAM_CONCURRENCY = 4
+UPSTREAM_LATENCY = 0.2
+
+
+class FakeGeminiClient:
+    """Async client answering like Gemini, within a request rate and a number of calls in flight."""
+
+    def __init__(self):
+        self.quota = TokenBucket(UPSTREAM_RPS * 60, capacity=UPSTREAM_RPS)
+        self.in_flight = 0
+        self.rejected = 0
+
+    async def generate_content(self, request, metadata=None, retry=None) -> GenerateContentResponse:
+        if self.quota.reserve(1) > 0:
+            self.quota.refund(1)
+            self.rejected += 1
+            raise exceptions.ResourceExhausted("Quota exceeded")
+        if self.in_flight >= UPSTREAM_CONCURRENCY:
+            self.rejected += 1
+            raise exceptions.ServiceUnavailable("The model is overloaded")
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(UPSTREAM_LATENCY * (1 + self.in_flight / UPSTREAM_CONCURRENCY))
+        finally:
+            self.in_flight -= 1
+        return GenerateContentResponse(
+            candidates=[Candidate(content=Content(parts=[Part(text="There are 50 properties.")], role="model"))],
+            usage_metadata=GenerateContentResponse.UsageMetadata(
+                prompt_token_count=20, candidates_token_count=6, total_token_count=26
+            ),
+        )
+
+
+async def turn(model: ChatGoogleGenerativeAI) -> bool:
+    try:
+        for _ in range(CALLS_PER_TURN):
+            await model.ainvoke("How many properties are there?")
+    except exceptions.GoogleAPICallError:
+        return False
+    return True
+
+
+async def run(name: str, model: ChatGoogleGenerativeAI, turns: int) -> None:
+    client = FakeGeminiClient()
+    model.async_client_running = client
+    start = time.perf_counter()
+    results = await asyncio.gather(*(turn(model) for _ in range(turns)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:>7}: {sum(results)}/{turns} turns completed in {elapsed:.1f}s, "
+        f"{client.rejected} calls rejected upstream"
+    )
+
+
+async def benchmark(turns: int) -> None:
+    await run("plain", ChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key="fake"), turns)
+    model_module.rate_limiter = RateLimiter(
+        requests_per_minute=UPSTREAM_RPS * 60,
+        tokens_per_minute=0,
+        max_concurrency=2 * UPSTREAM_CONCURRENCY,
+        latency_target=1.0,
+        request_burst=UPSTREAM_RPS,
+    )
+    await run("limited", RateLimitedChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key="fake"), turns)
+    print(f"limiter: {model_module.rate_limiter.stats()}")
+
+
+def main() -> None:
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else TURNS
+    asyncio.run(benchmark(turns))
+
+
+if __name__ == "__main__":
+    main()
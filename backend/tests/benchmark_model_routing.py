@@ -0,0 +1,108 @@
+"""
+Compare the latency of agent turns answered by the strong model alone and by the model router.
+
+Fake Gemini async clients stand in for the API: the fast model answers in `FAST_LATENCY` seconds and
+the strong model in `STRONG_LATENCY` seconds. Each turn replays the steps of a ReAct loop (list the
+tables, look up a schema, run a query, answer), calling the model once per step. A share of the queries
+fail, as a wrong SQL query would, and are retried once. Two runs are compared on the same questions:
+- single: every step on `RateLimitedChatGoogleGenerativeAI`, the strong model
+- routed: `RoutedChatModel`, routing each step between the fast and the strong model
+
+Usage: uv run python tests/benchmark_model_routing.py
+"""
+
+import asyncio
+import statistics
+import time
+
+from google.ai.generativelanguage_v1beta.types import Candidate, Content, GenerateContentResponse, Part
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from app.chatbot import model as model_module
+from app.chatbot.model import RateLimitedChatGoogleGenerativeAI, RoutedChatModel
+from app.chatbot.rate_limit import RateLimiter
+
+FAST_LATENCY = 0.05
+STRONG_LATENCY = 0.4
+QUESTIONS = [
+    "How many properties are there?",
+    "What is the price of the property at 12 Oak Street?",
+    "Which agent handles client Jane Doe?",
+    "List the properties in Springfield.",
+    "How many clients are there?",
+    "What is the average price per city?",
+    "Compare the sales of each agent over time.",
+    "Who bought the most expensive property?",
+]
+# Questions whose first query fails and is written again
+FAILING_QUESTIONS = {"Who bought the most expensive property?"}
+
+
+class FakeGeminiClient:
+    """Async client answering like Gemini after a fixed latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def generate_content(self, request, metadata=None, retry=None) -> GenerateContentResponse:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return GenerateContentResponse(
+            candidates=[Candidate(content=Content(parts=[Part(text="There are 50 properties.")], role="model"))],
+        )
+
+
+def create_model(latency: float) -> tuple[RateLimitedChatGoogleGenerativeAI, FakeGeminiClient]:
+    model = RateLimitedChatGoogleGenerativeAI(model="gemini-2.0-flash", google_api_key="fake")
+    model.async_client_running = FakeGeminiClient(latency)
+    return model, model.async_client_running
+
+
+def tool_step(index: int, output: str) -> list[BaseMessage]:
+    call_id = f"call-{index}"
+    return [
+        AIMessage(content="", tool_calls=[{"name": "sql_db_query", "args": {}, "id": call_id}]),
+        ToolMessage(content=output, tool_call_id=call_id),
+    ]
+
+
+async def turn(model: BaseChatModel, question: str) -> float:
+    outputs = ["properties, clients, agents, sales", "CREATE TABLE properties (...)"]
+    if question in FAILING_QUESTIONS:
+        outputs.append("Error: no such column: buyer")
+    outputs.append("[(50,)]")
+    messages: list[BaseMessage] = [HumanMessage(content=question)]
+    start = time.perf_counter()
+    for index, output in enumerate(outputs):
+        await model.ainvoke(messages)
+        messages.extend(tool_step(index, output))
+    await model.ainvoke(messages)
+    return time.perf_counter() - start
+
+
+async def run(name: str, model: BaseChatModel) -> None:
+    latencies = [await turn(model, question) for question in QUESTIONS]
+    print(
+        f"{name:>6}: median {statistics.median(latencies):.2f}s, "
+        f"max {max(latencies):.2f}s, total {sum(latencies):.2f}s over {len(QUESTIONS)} turns"
+    )
+
+
+async def benchmark() -> None:
+    model_module.rate_limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0)
+    strong, strong_client = create_model(STRONG_LATENCY)
+    await run("single", strong)
+    fast, fast_client = create_model(FAST_LATENCY)
+    strong, strong_client = create_model(STRONG_LATENCY)
+    await run("routed", RoutedChatModel(fast=fast, strong=strong))
+    print(f"routed: {fast_client.calls} calls to the fast model, {strong_client.calls} to the strong model")
+
+
+def main() -> None:
+    asyncio.run(benchmark())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measure the web search calls saved by the search cache, against the local stub search backend.
+
+`THREADS` conversations ask the search tool the same `QUERIES` at the same time, spelled slightly
+differently, as when several users ask about the same news. The stub backend answers after
+`SEARCH_LATENCY` seconds. Three runs are compared:
+- uncached: every lookup calls the backend
+- cached: lookups go through a `SearchCache`, concurrent identical lookups share one call
+- restarted: a new `SearchCache` on the same file, as after a restart of the application
+
+Usage: uv run python tests/benchmark_search_cache.py [threads]
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from app.chatbot.search_cache import SearchCache, StubSearchBackend
+
+THREADS = 20
+SEARCH_LATENCY = 0.3
+MAX_RESULTS = 2
+QUERIES = [
+    "Average house price in Springfield 2025",
+    "mortgage rates today",
+    "Property tax changes this year",
+]
+
+
+def spellings(query: str, thread: int) -> str:
+    """The query as written by the conversation, in one of a few spellings."""
+    return [query, query.lower(), f"  {query}?", query.upper()][thread % 4]
+
+
+async def ask(search, thread: int) -> None:
+    for query in QUERIES:
+        await search(spellings(query, thread), MAX_RESULTS)
+
+
+async def run(name: str, search, backend: StubSearchBackend, threads: int) -> None:
+    start = time.perf_counter()
+    await asyncio.gather(*(ask(search, thread) for thread in range(threads)))
+    elapsed = time.perf_counter() - start
+    print(f"{name:>9}: {threads * len(QUERIES)} lookups, {backend.calls} backend calls in {elapsed:.2f}s")
+
+
+async def benchmark(threads: int) -> None:
+    backend = StubSearchBackend(SEARCH_LATENCY)
+    await run("uncached", backend.search, backend, threads)
+    with tempfile.TemporaryDirectory() as directory:
+        path = str(Path(directory) / "search_results.sqlite")
+        backend = StubSearchBackend(SEARCH_LATENCY)
+        cache = SearchCache(backend, path)
+        await run("cached", cache.search, backend, threads)
+        print(f"    cache: {cache.stats()}")
+        backend = StubSearchBackend(SEARCH_LATENCY)
+        await run("restarted", SearchCache(backend, path).search, backend, threads)
+
+
+def main() -> None:
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else THREADS
+    asyncio.run(benchmark(threads))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Check that the answer cache never serves the answer to a follow-up question to another thread.
+
+A fake model answers from the conversation only: it knows the user's name if an earlier message of the thread
+gave it, and the properties "ones" refer to if an earlier message named them. Follow-ups asked mid-conversation
+in one thread are then asked first in new threads, which must call the model rather than get the first thread's
+answer. A first question repeated in a new thread must still be answered from the cache.
+
+Usage: uv run python tests/test_answer_cache.py (or through pytest)
+"""
+
+import asyncio
+import tempfile
+from pathlib import Path
+
+import aiosqlite
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langgraph.prebuilt import create_react_agent
+
+from app.chatbot.chatbot_core import Chatbot
+from app.chatbot.context import ChatbotState
+from app.chatbot.memory import PooledSqliteSaver
+from app.chatbot.render_cache import RenderCache
+
+
+class ConversationModel(BaseChatModel):
+    """Fake model answering from the earlier messages of the conversation, counting its calls."""
+
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "conversation"
+
+    def answer(self, messages: list[BaseMessage]) -> str:
+        history = " ".join(str(message.content) for message in messages[:-1] if isinstance(message, HumanMessage))
+        question = str(messages[-1].content).lower()
+        if "name" in question:
+            return "Your name is Alice." if "My name is Alice" in history else "I do not know your name."
+        if "cheapest" in question:
+            return "The cheapest villas are in Giza." if "villas" in history else "Which properties do you mean?"
+        return f"Noted: {messages[-1].content}"
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.calls += 1
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.answer(messages)))])
+
+
+async def ask(chatbot: Chatbot, model: ConversationModel, thread_id: str, message: str) -> tuple[str, bool]:
+    """Send a message, returning the answer and whether the model was called for it."""
+    calls = model.calls
+    answer = await chatbot.process_message(message, thread_id)
+    return answer, model.calls > calls
+
+
+async def check_follow_ups(chatbot: Chatbot, model: ConversationModel) -> None:
+    await ask(chatbot, model, "a", "My name is Alice and I earn 40k")
+    assert "Alice" in (await ask(chatbot, model, "a", "What is my name?"))[0]
+    answer, called = await ask(chatbot, model, "b", "what is my name")
+    assert called and "Alice" not in answer, f"Thread b got the answer of thread a: {answer}"
+
+    await ask(chatbot, model, "c", "List the villas for sale")
+    for message in ("Which ones are cheapest?", "Sort by price", "Show the first one"):
+        await ask(chatbot, model, "c", message)
+    for thread_id, message in (("d", "Which ones are cheapest?"), ("e", "Sort by price"), ("f", "Show the first one")):
+        answer, called = await ask(chatbot, model, thread_id, message)
+        assert called and "Giza" not in answer, f"Thread {thread_id} got the answer of thread c: {answer}"
+
+    await ask(chatbot, model, "g", "How many properties are there in Cairo?")
+    answer, called = await ask(chatbot, model, "h", "how many properties are there in cairo")
+    assert not called and "Cairo" in answer, "A repeated first question was not answered from the cache"
+
+
+async def check_answer_cache() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "checkpoints.sqlite"
+        async with aiosqlite.connect(path) as writer, aiosqlite.connect(path) as reader:
+            memory = PooledSqliteSaver(writer, [reader])
+            try:
+                chatbot = Chatbot(memory, RenderCache())
+                model = ConversationModel()
+                chatbot.agent = create_react_agent(
+                    model=model, tools=[], checkpointer=memory, state_schema=ChatbotState
+                )
+                await check_follow_ups(chatbot, model)
+            finally:
+                await chatbot.scheduler.aclose()
+                await memory.aclose()
+
+
+def test_follow_ups_are_not_shared_between_threads() -> None:
+    asyncio.run(check_answer_cache())
+
+
+def main() -> None:
+    test_follow_ups_are_not_shared_between_threads()
+    print("OK: follow-up answers stay in their thread, repeated first questions hit the cache")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Check that the context window folds every message into the conversation summary only once.
+
+A turn with a large tool output pushes the window start forward while it is the current turn. Once the output is
+truncated, on the next turn, the window starts before the messages already summarized. A fake summarizer records
+the messages it is given over `TURNS` turns: none may be given twice, and the summary cursor may never move back.
+
+Usage: uv run python tests/test_context.py (or through pytest)
+"""
+
+import re
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import Field
+
+from app.chatbot.context import ContextWindow
+
+TURNS = "ABCDEFG"
+# Turn whose tool output alone exceeds the token budget of the window
+LARGE_OUTPUT_TURN = "C"
+
+
+class RecordingSummarizer(BaseChatModel):
+    """Fake model answering summary prompts, recording the IDs of the new messages it was given."""
+
+    lines: list[str] = Field(default_factory=list)
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording-summarizer"
+
+    def _generate(self, messages: list[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = str(messages[-1].content)
+        new_messages = prompt.split("New messages:\n", 1)[1].split("\n\nUpdated summary:", 1)[0]
+        self.lines.extend(re.findall(r"^\w+: (\w+)", new_messages, re.MULTILINE))
+        summary = f"Summary of {len(self.lines)} messages."
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=summary))])
+
+
+def turn_messages(turn: str) -> list[BaseMessage]:
+    """The messages of a turn, each starting with its ID: question, tool call, tool output, answer."""
+    output = f"t{turn} " + ("row " * 3000 if turn == LARGE_OUTPUT_TURN else "rows")
+    return [
+        HumanMessage(content=f"h{turn} question", id=f"h{turn}"),
+        AIMessage(content=f"a{turn} call", id=f"a{turn}", tool_calls=[{"name": "query", "args": {}, "id": turn}]),
+        ToolMessage(content=output, id=f"t{turn}", tool_call_id=turn),
+        AIMessage(content=f"r{turn} answer", id=f"r{turn}"),
+    ]
+
+
+def step(context_window: ContextWindow, state: dict) -> None:
+    """Run the context window before a model call, keeping its summary in the state like the checkpointer."""
+    update = context_window.invoke(state)
+    for key in ("summary", "summarized_until"):
+        if key in update:
+            state[key] = update[key]
+
+
+def cursor(state: dict) -> int:
+    ids = [message.id for message in state["messages"]]
+    return ids.index(state["summarized_until"]) if state.get("summarized_until") else -1
+
+
+def check_summarized_once() -> None:
+    summarizer = RecordingSummarizer()
+    context_window = ContextWindow(summarizer, max_turns=3, max_tokens=2000, max_tool_chars=200)
+    state: dict = {"messages": [], "summary": "", "summarized_until": None}
+    for turn in TURNS:
+        # A model call at each step of the turn: after the question and after the tool output
+        question, call, output, answer = turn_messages(turn)
+        for messages in ([question], [call, output]):
+            state["messages"].extend(messages)
+            before = cursor(state)
+            step(context_window, state)
+            assert cursor(state) >= before, f"The summary cursor moved back during turn {turn}"
+        state["messages"].append(answer)
+
+    repeated = {line for line in summarizer.lines if summarizer.lines.count(line) > 1}
+    assert not repeated, f"Messages summarized more than once: {sorted(repeated)}"
+    assert {"hA", "rA", "hB", "rB"} <= set(summarizer.lines), "The older turns were not summarized"
+
+
+def test_messages_are_summarized_once() -> None:
+    check_summarized_once()
+
+
+def main() -> None:
+    test_messages_are_summarized_once()
+    print(f"OK: {len(TURNS)} turns summarized without repeating a message")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,20 @@
+import asyncio
+
 from app.chatbot.chatbot_core import Chatbot
+from app.chatbot.memory import open_memory
+
+
+async def main() -> None:
+    async with open_memory() as memory:
+        chatbot = Chatbot(memory)
+
+        config = {"configurable": {"thread_id": "1"}}
+        response = await chatbot.agent.ainvoke({"messages": [{"role": "user", "content": "Hello!"}]}, config)
+        response_text = response["messages"][-1].content
 
-chatbot = Chatbot()
+        # print(f"{response = }")
+        print(f"{response_text = }")
+        print(f"{response.keys() = }")
 
-config = {"configurable": {"thread_id": "1"}}
-response = chatbot.agent.invoke({"messages": [{"role": "user", "content": "Hello!"}]}, config)
-response_text = response["messages"][-1].content
 
-# print(f"{response = }")
-print(f"{response_text = }")
-print(f"{response.keys() = }")
+asyncio.run(main())
@@ -0,0 +1,111 @@
+"""
+Check that `PooledSqliteSaver` stores and loads checkpoints like `AsyncSqliteSaver`, under concurrent writes.
+
+`THREADS` conversations put `STEPS` checkpoints each, with their pending writes, all at once on both savers,
+each on its own temporary file, while reading their latest state in between. The latest checkpoint and the
+full history of every thread must then be the same on both. A batch whose commit and rollback both fail
+must fail its writes without stopping the writer task.
+
+Usage: uv run python tests/test_memory.py (or through pytest)
+"""
+
+import asyncio
+import tempfile
+from pathlib import Path
+
+import aiosqlite
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from app.chatbot.memory import PooledSqliteSaver
+
+THREADS = 8
+STEPS = 5
+
+
+async def run_thread(saver: AsyncSqliteSaver, thread_id: str) -> None:
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    checkpoint = empty_checkpoint()
+    for step in range(STEPS):
+        checkpoint = create_checkpoint(checkpoint, None, step)
+        # Checkpoint IDs are random, fixed ones let the two savers be compared
+        checkpoint["id"] = f"{thread_id}-{step:04d}"
+        checkpoint["channel_values"] = {"messages": [f"{thread_id} message {step}"]}
+        config = await saver.aput(config, checkpoint, {"source": "loop", "step": step, "writes": {}}, {})
+        await saver.aput_writes(config, [("messages", f"{thread_id} pending {step}"), ("branch", step)], "task")
+        latest = await saver.aget_tuple({"configurable": {"thread_id": thread_id}})
+        assert latest is not None and latest.checkpoint["id"] == checkpoint["id"]
+
+
+def snapshot(checkpoint_tuple) -> tuple:
+    return (
+        checkpoint_tuple.config,
+        checkpoint_tuple.checkpoint["channel_values"],
+        checkpoint_tuple.metadata,
+        checkpoint_tuple.parent_config,
+        checkpoint_tuple.pending_writes,
+    )
+
+
+async def thread_state(saver: AsyncSqliteSaver, thread_id: str) -> tuple:
+    config = {"configurable": {"thread_id": thread_id}}
+    latest = await saver.aget_tuple(config)
+    history = [snapshot(checkpoint_tuple) async for checkpoint_tuple in saver.alist(config)]
+    return snapshot(latest), history
+
+
+async def write_threads(saver: AsyncSqliteSaver) -> dict[str, tuple]:
+    thread_ids = [f"thread-{index}" for index in range(THREADS)]
+    await asyncio.gather(*(run_thread(saver, thread_id) for thread_id in thread_ids))
+    return {thread_id: await thread_state(saver, thread_id) for thread_id in thread_ids}
+
+
+async def check_failed_batch(saver: PooledSqliteSaver) -> None:
+    async def fail() -> None:
+        raise aiosqlite.OperationalError("disk I/O error")
+
+    commit, rollback = saver.conn.commit, saver.conn.rollback
+    saver.conn.commit = saver.conn.rollback = fail
+    try:
+        await saver.adelete_threads(["thread-0"])
+    except aiosqlite.OperationalError:
+        pass
+    else:
+        raise AssertionError("The failed write did not raise")
+    finally:
+        saver.conn.commit, saver.conn.rollback = commit, rollback
+    await asyncio.wait_for(saver.adelete_threads(["thread-0"]), timeout=5)
+    assert await saver.aget_tuple({"configurable": {"thread_id": "thread-0"}}) is None
+
+
+async def check_parity() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        async with aiosqlite.connect(Path(directory) / "reference.sqlite") as conn:
+            reference = await write_threads(AsyncSqliteSaver(conn))
+
+        path = Path(directory) / "pooled.sqlite"
+        async with (
+            aiosqlite.connect(path) as writer,
+            aiosqlite.connect(path) as reader1,
+            aiosqlite.connect(path) as reader2,
+        ):
+            saver = PooledSqliteSaver(writer, [reader1, reader2])
+            try:
+                pooled = await write_threads(saver)
+                assert pooled == reference, "The pooled saver loads different checkpoints"
+                await check_failed_batch(saver)
+            finally:
+                await asyncio.wait_for(saver.aclose(), timeout=5)
+
+
+def test_pooled_saver_matches_async_sqlite_saver() -> None:
+    asyncio.run(check_parity())
+
+
+def main() -> None:
+    test_pooled_saver_matches_async_sqlite_saver()
+    print(f"OK: {THREADS} threads of {STEPS} checkpoints load the same from both savers")
+
+
+if __name__ == "__main__":
+    main()